@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+'''
+A compressed archive format for Naughty/Nice chains that keeps per-block random access.
+
+Blocks are grouped into frames of a few consecutive blocks and every frame is compressed on its own
+(zlib or lzma). A frame index at the end of the file says which frame holds each block and where in
+the decompressed frame it sits, so reading a block only decompresses its own frame. The blocks are
+stored exactly as in a chain file, so converting back gives a byte-identical blockchain.dat.
+
+Layout: the archive_magic from naughty_nice.py and one codec byte, the compressed frames, the frame
+index (a record per frame, then a record per block) and a footer holding the offset of the index.
+Chain(load=True, filename=...) and load_chain() recognize an archive and read it transparently.
+
+    compress_chain(<chain_filename>, <filename>, <codec>, <blocks_per_frame>) - writes an archive
+    (by default <chain file>.nna, zlib, 16 blocks per frame) from a chain file.
+
+    decompress_chain(filename, <chain_filename>) - writes the chain file back out, with a fresh
+    checksum sidecar.
+
+    ArchiveReader(filename) - len() is the number of blocks, iteration yields every block in order,
+    get(position) the block at a position and find(index) the block with a given block index,
+    decompressing only the frames needed.
+'''
+
+import bisect
+import io
+import lzma
+import struct
+import sys
+import zlib
+
+from naughty_nice import Block, archive_magic, checksum_filename, checksum_record, iter_headers
+
+codecs = {0: (zlib.compress, zlib.decompress), 1: (lzma.compress, lzma.decompress)}
+codec_ids = {'zlib': 0, 'lzma': 1}
+
+frame_record = struct.Struct('>QQI')  # file offset, compressed length, blocks
+block_record = struct.Struct('>QIQ')  # block index, frame, offset within the decompressed frame
+footer = struct.Struct('>QQQ4s')  # index offset, frames, blocks, magic
+
+
+def compress_chain(chain_filename=None, filename=None, codec='zlib', blocks_per_frame=16):
+    if chain_filename is None:
+        chain_filename = 'blockchain.dat'
+    if filename is None:
+        filename = chain_filename + '.nna'
+    compress = codecs[codec_ids[codec]][0]
+    frames, blocks = [], []
+    with open(chain_filename, 'rb') as source, open(filename, 'wb') as fh:
+        fh.write(archive_magic + bytes([codec_ids[codec]]))
+        pending = []
+
+        def flush():
+            data = b''.join(pending)
+            compressed = compress(data)
+            frames.append((fh.tell(), len(compressed), len(pending)))
+            fh.write(compressed)
+            pending.clear()
+
+        frame_offset = 0
+        for h in iter_headers(chain_filename):
+            source.seek(h['offset'])
+            pending.append(source.read(h['length']))
+            blocks.append((h['index'], len(frames), frame_offset))
+            frame_offset += h['length']
+            if len(pending) == blocks_per_frame:
+                flush()
+                frame_offset = 0
+        if pending:
+            flush()
+        index_offset = fh.tell()
+        for f in frames:
+            fh.write(frame_record.pack(*f))
+        for b in blocks:
+            fh.write(block_record.pack(*b))
+        fh.write(footer.pack(index_offset, len(frames), len(blocks), archive_magic))
+    return len(blocks)
+
+
+def decompress_chain(filename, chain_filename=None):
+    if chain_filename is None:
+        chain_filename = 'blockchain.dat'
+    reader = ArchiveReader(filename)
+    starts = {}  # frame -> offsets of its blocks within the decompressed frame
+    for index, frame, offset in reader.blocks:
+        starts.setdefault(frame, []).append(offset)
+    with open(chain_filename, 'wb') as fh, open(checksum_filename(chain_filename), 'wb') as ch:
+        for n in range(len(reader.frames)):
+            data = reader.frame(n)
+            base = fh.tell()
+            fh.write(data)
+            offsets = starts.get(n, [])
+            for start, end in zip(offsets, offsets[1:] + [len(data)]):
+                ch.write(checksum_record.pack(base + start, end - start, zlib.crc32(data[start:end])))
+    return len(reader)
+
+
+class ArchiveReader():
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as fh:
+            head = fh.read(len(archive_magic) + 1)
+            if head[:len(archive_magic)] != archive_magic:
+                raise ValueError('%s is not a chain archive' % (filename))
+            self.decompress = codecs[head[-1]][1]
+            fh.seek(-footer.size, 2)
+            index_offset, frames, blocks, magic = footer.unpack(fh.read(footer.size))
+            if magic != archive_magic:
+                raise ValueError('%s is truncated' % (filename))
+            fh.seek(index_offset)
+            self.frames = list(frame_record.iter_unpack(fh.read(frames * frame_record.size)))
+            self.blocks = list(block_record.iter_unpack(fh.read(blocks * block_record.size)))
+        self.indexes = [b[0] for b in self.blocks]
+        self._cached = (None, None)  # the last frame decompressed, as (frame, data)
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def __iter__(self):
+        for position in range(len(self.blocks)):
+            yield self.get(position)
+
+    def frame(self, n):
+        if self._cached[0] != n:
+            offset, length, count = self.frames[n]
+            with open(self.filename, 'rb') as fh:
+                fh.seek(offset)
+                self._cached = (n, self.decompress(fh.read(length)))
+        return self._cached[1]
+
+    def get(self, position):
+        index, frame, offset = self.blocks[position]
+        fh = io.BytesIO(self.frame(frame))
+        fh.seek(offset)
+        return Block(load=True).load_a_block(fh)
+
+    def find(self, index):
+        # block indexes only increase along a chain, so the position can be found by bisection
+        position = bisect.bisect_left(self.indexes, index)
+        if position == len(self.indexes) or self.indexes[position] != index:
+            return None
+        return self.get(position)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] not in ('compress', 'decompress'):
+        print('usage: %s compress <chain file> [archive] [zlib|lzma] | %s decompress <archive> <chain file>' % (sys.argv[0], sys.argv[0]))
+        sys.exit(1)
+    if sys.argv[1] == 'compress':
+        count = compress_chain(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None, sys.argv[4] if len(sys.argv) > 4 else 'zlib')
+    else:
+        count = decompress_chain(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)
+    print('%i block(s) written' % (count))
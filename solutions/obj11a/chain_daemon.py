@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+'''
+A long-running query server that keeps Naughty/Nice chains indexed in memory, so that scripts do
+not each pay for loading a chain and importing a key.
+
+The server listens on a Unix socket. For every chain it serves it holds the offset, length and index
+of every block and the positions of every pid's blocks (from a header-only scan), plus the chain's
+digest index (see digest_index.py); the public key is imported once. Blocks themselves are read from
+the file when asked for, and requests are answered one at a time. Before each request the chain file
+is checked for growth and only the appended blocks are scanned, so the server follows a chain that
+is being written to.
+
+Requests and responses are single lines of JSON. Every request names an 'op' and (except 'chains')
+a 'chain'; a failed request gets back {"error": <message>}.
+
+    {"op": "chains"} - the chains served, with their block counts.
+    {"op": "get", "chain": c, "position": n} or {..., "index": i} - a block's fields, with its
+    documents as type and length only.
+    {"op": "verify", "chain": c, "start": n, "end": m, <"previous_hash": h>} - the verify_chain(
+    audit=True) failures for the blocks at positions n..m-1 (by default the whole chain).
+    {"op": "pid", "chain": c, "pid": p} - the position, index and offset of every block for a pid.
+    {"op": "digest", "chain": c, "digest": d} - the block with that SHA256 or full hash.
+    {"op": "dump", "chain": c, "position": n, "document": k} - document k (from 1) of a block, with
+    its data base64 encoded.
+
+    ChainServer(socket_path, chains, <public_key>) - chains maps names to chain files. Call
+    serve_forever() to run it.
+
+    query(socket_path, request) - sends one request and returns the response.
+
+From the command line: "python3 chain_daemon.py serve <socket> <public key> <name>=<chain file> ..."
+and "python3 chain_daemon.py query <socket> '<JSON request>'".
+'''
+
+from base64 import b64encode
+import bisect
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+
+from Crypto.PublicKey import RSA
+
+from digest_index import DigestIndex
+from naughty_nice import Block, Chain, genesis_block_fake_hash, iter_headers
+
+
+class ServedChain():
+    def __init__(self, filename):
+        self.filename = filename
+        self.digests = DigestIndex(filename)
+        self.reload()
+
+    def reload(self):
+        self.offsets, self.lengths, self.indexes, self.pids = [], [], [], {}
+        self.end = 0
+        self.refresh()
+
+    def refresh(self):
+        # scans the blocks appended since the last refresh; a file that shrank is scanned afresh
+        size = os.path.getsize(self.filename)
+        if size < self.end:
+            self.digests.db.execute('DELETE FROM blocks')
+            return self.reload()
+        if size == self.end:
+            return 0
+        count = 0
+        for h in iter_headers(self.filename, self.end):
+            self.pids.setdefault(h['pid'], []).append(len(self.offsets))
+            self.offsets.append(h['offset'])
+            self.lengths.append(h['length'])
+            self.indexes.append(h['index'])
+            self.end = h['offset'] + h['length']
+            count += 1
+        self.digests.update()
+        return count
+
+    def block(self, position):
+        if not 0 <= position < len(self.offsets):
+            raise IndexError('no block at position %i' % (position))
+        with open(self.filename, 'rb') as fh:
+            fh.seek(self.offsets[position])
+            return Block(load=True).load_a_block(fh)
+
+    def position(self, index):
+        # block indexes only increase along a chain, so the position can be found by bisection
+        position = bisect.bisect_left(self.indexes, index)
+        if position == len(self.indexes) or self.indexes[position] != index:
+            raise IndexError('no block with index %i' % (index))
+        return position
+
+    def verify(self, publickey, start=0, end=None, previous_hash=None):
+        if end is None:
+            end = len(self.offsets)
+        c = Chain.__new__(Chain)  # just the blocks asked for, checked against the one before them
+        c.blocks = [self.block(position) for position in range(start, end)]
+        if not c.blocks:
+            return []
+        c.initial_index = c.blocks[0].index
+        if start > 0:
+            previous = self.block(start - 1)
+            previous_hash, c.initial_index = previous.full_hash(), previous.index + 1
+        failures = c.verify_chain(publickey, previous_hash or genesis_block_fake_hash, audit=True)
+        for f in failures:
+            f['position'] += start
+        return failures
+
+
+def _describe(block, position, offset):
+    return {'position': position, 'offset': offset, 'index': block.index, 'nonce': block.nonce, 'pid': block.pid,
+            'rid': block.rid, 'doc_count': block.doc_count, 'score': block.score, 'sign': block.sign,
+            'documents': [{'type': d['type'], 'length': d['length']} for d in block.data],
+            'month': block.month, 'day': block.day, 'hour': block.hour, 'minute': block.minute, 'second': block.second,
+            'previous_hash': block.previous_hash, 'hash': block.hash, 'sig': block.sig.decode('utf-8', 'replace')}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.server.answer(json.loads(line))
+            except Exception as e:
+                response = {'error': '%s: %s' % (type(e).__name__, e)}
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+class ChainServer(socketserver.UnixStreamServer):
+    def __init__(self, socket_path, chains, publickey=None):
+        self.chains = {name: ServedChain(filename) for name, filename in chains.items()}
+        self.publickey = publickey
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        socketserver.UnixStreamServer.__init__(self, socket_path, _Handler)
+
+    def answer(self, request):
+        op = request['op']
+        if op == 'chains':
+            for c in self.chains.values():
+                c.refresh()
+            return {name: {'filename': c.filename, 'blocks': len(c.offsets)} for name, c in self.chains.items()}
+        c = self.chains[request['chain']]
+        c.refresh()
+        if op == 'get':
+            position = c.position(request['index']) if 'index' in request else request['position']
+            return _describe(c.block(position), position, c.offsets[position])
+        elif op == 'verify':
+            if self.publickey is None:
+                raise ValueError('the server was started without a public key')
+            return {'failures': c.verify(self.publickey, request.get('start', 0), request.get('end'), request.get('previous_hash'))}
+        elif op == 'pid':
+            positions = c.pids.get(int(request['pid']), [])
+            return {'blocks': [{'position': p, 'index': c.indexes[p], 'offset': c.offsets[p]} for p in positions]}
+        elif op == 'digest':
+            digest = request['digest']
+            found = c.digests.find_sha256(digest) if len(digest) == 64 else c.digests.find_full_hash(digest)
+            if found is None:
+                return {'block': None}
+            position = bisect.bisect_left(c.offsets, found[1])
+            return {'block': {'position': position, 'index': found[0], 'offset': found[1]}}
+        elif op == 'dump':
+            position = c.position(request['index']) if 'index' in request else request['position']
+            d = c.block(position).data[request.get('document', 1) - 1]
+            return {'type': d['type'], 'length': d['length'], 'data': b64encode(d['data']).decode('utf-8')}
+        raise ValueError('unknown op %r' % (op))
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        for c in self.chains.values():
+            c.digests.close()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+def query(socket_path, request):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(socket_path)
+        s.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        with s.makefile('rb') as fh:
+            return json.loads(fh.readline())
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 4 or sys.argv[1] not in ('serve', 'query'):
+        print('usage: %s serve <socket> <public key> <name>=<chain file> ... | %s query <socket> <JSON request>' % (sys.argv[0], sys.argv[0]))
+        sys.exit(1)
+    if sys.argv[1] == 'query':
+        print(json.dumps(query(sys.argv[2], json.loads(sys.argv[3])), indent=1))
+        sys.exit(0)
+    with open(sys.argv[3], 'rb') as fh:
+        key = RSA.importKey(fh.read())
+    server = ChainServer(sys.argv[2], dict(a.split('=', 1) for a in sys.argv[4:]), key)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))  # still remove the socket
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
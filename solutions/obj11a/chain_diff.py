@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+'''
+Compares two Naughty/Nice chain files (an original and an edited copy, say) and shows exactly
+what differs, without parsing either chain in full.
+
+The differing blocks are found one of three ways. When both chain files have a digest index (see
+digest_index.py), the cached SHA256 of every block is compared: this finds every changed block,
+including one edited with an MD5 collision so that its full hash, and so the rest of the chain, is
+unchanged. Otherwise, when both have a checksum sidecar covering all their blocks, the CRC32 records
+in the sidecars are compared, which finds every block whose bytes changed without reading either
+chain. Failing that, the first differing block is found by a binary search on full hashes as in
+chain_sync.py, reading only a few blocks. That finds where two chains part, but relies on each block
+linking to the one before it, so a block edited in place (with an MD5 collision, or without fixing up
+the blocks after it) can go unseen; so can a block edited by hand after its sidecar was written. So
+when the checksums or the search find no difference in the blocks the two chains share, the result
+is marked inconclusive, unless a thorough diff was asked for: then those blocks are also compared
+byte for byte, which reads both chains in full. (A SHA256 comparison is never inconclusive.) Only
+the differing blocks are then read and compared, field by
+field (header fields, timestamp, hashes, signature and every document's type, length, data and file
+offset) and, within each differing field of equal length, byte by byte.
+
+    diff_chains(filename_a, filename_b, <index>, <limit>, <thorough>) - returns a dictionary with
+    the 'method' used ('digests', 'checksums', 'search' or, when only the byte comparison found
+    them, 'bytes'), the number of 'blocks' in each chain, the 'differing' positions (for a search,
+    the first differing position onward), the 'differences' of the first limit (default 10) of
+    them and whether the result is 'inconclusive' (no difference found in the shared blocks, which
+    were not compared byte for byte). index=True builds or updates both digest indexes, index=False
+    never uses them, and by default the indexes are used when both chains have one. thorough=True
+    compares the shared blocks byte for byte when nothing else found a difference in them.
+
+    diff_blocks(a, b) - the field differences between two blocks: a list of dictionaries with the
+    'field' name, its values 'a' and 'b' and, for fields of equal length, the 'bytes' that differ
+    as (offset in block a, bytes in a, bytes in b) runs.
+'''
+
+import os
+import sys
+
+from chain_sync import divergence
+from digest_index import DigestIndex
+from naughty_nice import Block, block_offsets, checksum_filename, checksum_record
+
+
+def _byte_runs(a, b, base):
+    # runs of differing bytes between two equal-length byte strings, as (base + offset, a, b);
+    # equal stretches are skipped a chunk at a time
+    runs, start, step = [], None, 4096
+    for chunk in range(0, len(a), step):
+        if a[chunk:chunk + step] == b[chunk:chunk + step]:
+            if start is not None:
+                runs.append((base + start, a[start:chunk], b[start:chunk]))
+                start = None
+            continue
+        for n in range(chunk, min(chunk + step, len(a))):
+            if a[n] != b[n] and start is None:
+                start = n
+            elif a[n] == b[n] and start is not None:
+                runs.append((base + start, a[start:n], b[start:n]))
+                start = None
+    if start is not None:
+        runs.append((base + start, a[start:], b[start:]))
+    return runs
+
+
+def _field_values(block):
+    # name -> (value, offset in block_data_signed(), raw bytes) for every field of a block
+    data = block.block_data_signed()
+    values = {}
+    for name, offset, length in block.field_offsets():
+        if name.startswith('document '):
+            n, part = name.split(' ')[1:]
+            value = block.data[int(n) - 1][part] if part != 'data' else '%i bytes' % (length)
+        else:
+            value = getattr(block, name)
+        values[name] = (value, offset, data[offset:offset + length])
+    return values
+
+
+def diff_blocks(a, b):
+    fields_a, fields_b = _field_values(a), _field_values(b)
+    differences = []
+    for name in list(fields_a) + [n for n in fields_b if n not in fields_a]:
+        value_a, offset_a, raw_a = fields_a.get(name, (None, None, b''))
+        value_b, offset_b, raw_b = fields_b.get(name, (None, None, b''))
+        if raw_a == raw_b and offset_a == offset_b:
+            continue
+        d = {'field': name, 'a': value_a, 'b': value_b}
+        if raw_a != raw_b and len(raw_a) == len(raw_b):
+            d['bytes'] = _byte_runs(raw_a, raw_b, offset_a)
+        if offset_a != offset_b and None not in (offset_a, offset_b) and name.endswith(' data'):
+            d['offsets'] = (offset_a, offset_b)  # the document moved within the block
+        if raw_a != raw_b or 'offsets' in d:
+            differences.append(d)
+    return differences
+
+
+def _load(filename, offset):
+    with open(filename, 'rb') as fh:
+        fh.seek(offset)
+        return Block(load=True).load_a_block(fh)
+
+
+def _checksums(filename, blocks):
+    # the sidecar CRC32 of every block, or None unless the sidecar covers all of them
+    if not os.path.exists(checksum_filename(filename)):
+        return None
+    with open(checksum_filename(filename), 'rb') as ch:
+        records = ch.read()
+    records = list(checksum_record.iter_unpack(records[:len(records) - len(records) % checksum_record.size]))
+    if len(records) < len(blocks) or any((o, l) != b for (o, l, c), b in zip(records, blocks)):
+        return None
+    return [c for o, l, c in records[:len(blocks)]]
+
+
+def _differing_bytes(filename_a, filename_b, blocks_a, blocks_b):
+    # positions of the blocks the two chains share whose bytes differ
+    differing = []
+    with open(filename_a, 'rb') as fa, open(filename_b, 'rb') as fb:
+        for position, (x, y) in enumerate(zip(blocks_a, blocks_b)):
+            fa.seek(x[0])
+            fb.seek(y[0])
+            if x[1] != y[1] or fa.read(x[1]) != fb.read(y[1]):
+                differing.append(position)
+    return differing
+
+
+def diff_chains(filename_a, filename_b, index=None, limit=10, thorough=False):
+    if index is None:
+        index = os.path.exists(filename_a + '.digests') and os.path.exists(filename_b + '.digests')
+    if index:
+        digests = []
+        for filename in (filename_a, filename_b):
+            d = DigestIndex(filename)
+            d.update()  # only reads blocks appended since the index was last brought up to date
+            digests.append(d.digests())
+            d.close()
+        blocks_a, blocks_b = [(o, l) for o, l, s in digests[0]], [(o, l) for o, l, s in digests[1]]
+        differing = [n for n, (x, y) in enumerate(zip(digests[0], digests[1])) if x[2] != y[2]]
+        method = 'digests'
+    else:
+        blocks_a, blocks_b = block_offsets(filename_a), block_offsets(filename_b)
+        crcs_a, crcs_b = _checksums(filename_a, blocks_a), _checksums(filename_b, blocks_b)
+        if crcs_a is not None and crcs_b is not None:
+            differing = [n for n, (x, y) in enumerate(zip(crcs_a, crcs_b)) if x != y or blocks_a[n][1] != blocks_b[n][1]]
+            method = 'checksums'
+        else:
+            first, blocks_a, blocks_b = divergence(filename_a, filename_b)
+            differing = list(range(first, min(len(blocks_a), len(blocks_b))))
+            method = 'search'
+    inconclusive = not differing and method != 'digests'
+    if inconclusive and thorough:
+        # a sidecar written before an edit, or a block changed in place, can hide from the above
+        differing, inconclusive = _differing_bytes(filename_a, filename_b, blocks_a, blocks_b), False
+        if differing:
+            method = 'bytes'
+    differing += list(range(min(len(blocks_a), len(blocks_b)), max(len(blocks_a), len(blocks_b))))
+    result = {'method': method, 'blocks': (len(blocks_a), len(blocks_b)), 'differing': differing, 'inconclusive': inconclusive, 'differences': []}
+    for position in differing[:limit]:
+        a = _load(filename_a, blocks_a[position][0]) if position < len(blocks_a) else None
+        b = _load(filename_b, blocks_b[position][0]) if position < len(blocks_b) else None
+        entry = {'position': position, 'index_a': a.index if a else None, 'index_b': b.index if b else None,
+                 'offset_a': blocks_a[position][0] if a else None, 'offset_b': blocks_b[position][0] if b else None}
+        entry['fields'] = diff_blocks(a, b) if a is not None and b is not None else []
+        result['differences'].append(entry)
+    return result
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print('usage: %s <chain file> <chain file> [--index|--search] [--bytes]' % (sys.argv[0]))
+        sys.exit(1)
+    index = True if '--index' in sys.argv else False if '--search' in sys.argv else None
+    result = diff_chains(sys.argv[1], sys.argv[2], index, thorough='--bytes' in sys.argv)
+    print('%i and %i blocks, %i differing (%s)' % (result['blocks'][0], result['blocks'][1], len(result['differing']), result['method']))
+    if result['inconclusive']:
+        print('*** WARNING *** No difference found in the shared blocks by %s, which can miss a block edited in place; use --index or --bytes to be sure.' % (result['method']))
+    for d in result['differences']:
+        if d['index_a'] is None or d['index_b'] is None:
+            print('Position %i: only in %s (block %s)' % (d['position'], sys.argv[1] if d['index_b'] is None else sys.argv[2], d['index_a'] if d['index_b'] is None else d['index_b']))
+            continue
+        print('Position %i: block %i at offset %i / block %i at offset %i' % (d['position'], d['index_a'], d['offset_a'], d['index_b'], d['offset_b']))
+        for f in d['fields']:
+            if f['field'] in ('sig', 'previous_hash', 'hash') or f['field'].endswith(' data'):
+                print('    %s differs' % (f['field']) + (' (moved from byte %i to %i)' % f['offsets'] if 'offsets' in f else ''))
+            else:
+                print('    %s: %s -> %s' % (f['field'], f['a'], f['b']))
+            for offset, old, new in f.get('bytes', [])[:16]:
+                print('        byte %i (0x%x): %s -> %s' % (offset, offset, old.hex(), new.hex()))
+    sys.exit(1 if result['differing'] else 2 if result['inconclusive'] else 0)
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+
+'''
+Merges many Naughty/Nice chains into one time-ordered stream of blocks.
+
+Each chain is already in time order, so a k-way merge only ever needs the next unread block of
+every chain: memory grows with the number of chains, not with their length. Ties are broken by the
+position of the chain in the list given and then by block index, so the order is fully determined.
+
+    merge_chains(filenames, <headers_only>) - yields (chain filename, block) for every block of every
+    chain, ordered on (month, day, hour, minute, second, chain, index). With headers_only (the
+    default) the blocks are the iter_headers() dictionaries, and documents are never read; otherwise
+    they are full Block() objects.
+'''
+
+import heapq
+import sys
+
+from naughty_nice import iter_blocks, iter_headers
+
+
+def _keyed_headers(n, filename):
+    for h in iter_headers(filename):
+        yield (h['month'], h['day'], h['hour'], h['minute'], h['second'], n, h['index']), filename, h
+
+
+def _keyed_blocks(n, filename):
+    for offset, b in iter_blocks(filename):
+        yield (b.month, b.day, b.hour, b.minute, b.second, n, b.index), filename, b
+
+
+def merge_chains(filenames, headers_only=True):
+    keyed = _keyed_headers if headers_only else _keyed_blocks
+    # keys are unique, so heapq never has to compare the blocks themselves
+    for key, filename, block in heapq.merge(*[keyed(n, f) for n, f in enumerate(filenames)]):
+        yield filename, block
+
+
+if __name__ == '__main__':
+    for filename, h in merge_chains(sys.argv[1:] or ['blockchain.dat']):
+        print('%02.02i/%02.02i %02.02i:%02.02i:%02.02i %s block %i: pid %016.016x score %i sign %i' % (h['month'], h['day'], h['hour'], h['minute'], h['second'], filename, h['index'], h['pid'], h['score'], h['sign']))
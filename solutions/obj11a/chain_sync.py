@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+'''
+Keeps a replica of a Naughty/Nice chain file up to date with its source by copying only the blocks
+it is missing.
+
+Chains are append-only and every block holds the hash of the one before it, so two copies that
+agree on a block agree on everything before it. The point where they part is found by a binary
+search over block positions, comparing the full hash (the hash the next block links to) of the
+block at each probed position in both files: only a few blocks are ever read, however long the
+chains are. If the replica stops where the source goes on, the source's tail is appended to it
+(with its checksum sidecar records); if the two hold different blocks at the same position, the
+replica has forked and is left alone. (A block changed in place, with the blocks after it still
+linked to the original, is damage rather than a fork and may not be found this way: quick_check()
+and verify_chain() are the tools for that.)
+
+    divergence(filename_a, filename_b) - the position of the first block at which the two chain
+    files differ, plus the (offset, length) lists of both files' blocks.
+
+    sync_chain(source, replica, <dry_run>) - brings the replica up to date. Returns a dictionary
+    with the number of blocks the two have in 'common', the blocks and bytes 'copied' and, when the
+    replica has forked, the 'fork' position with the 'source_index' and 'replica_index' of the
+    blocks found there (otherwise 'fork' is None; a replica holding blocks the source does not have
+    is reported the same way, with a 'source_index' of None). A missing replica file is created; a partial
+    block at the end of the replica (an interrupted earlier copy) is cut off before copying.
+'''
+
+import os
+import sys
+import zlib
+
+from Crypto.Hash import MD5
+
+from naughty_nice import block_offsets, checksum_filename, checksum_record
+
+
+def _full_hash(fh, offset, length):
+    fh.seek(offset)
+    return MD5.new(fh.read(length)).hexdigest()
+
+
+def divergence(filename_a, filename_b):
+    blocks_a, blocks_b = block_offsets(filename_a), block_offsets(filename_b)
+    with open(filename_a, 'rb') as fa, open(filename_b, 'rb') as fb:
+        low, high = 0, min(len(blocks_a), len(blocks_b))
+        while low < high:
+            middle = (low + high) // 2
+            if blocks_a[middle] == blocks_b[middle] and _full_hash(fa, *blocks_a[middle]) == _full_hash(fb, *blocks_b[middle]):
+                low = middle + 1
+            else:
+                high = middle
+    return low, blocks_a, blocks_b
+
+
+def _index_at(filename, offset):
+    with open(filename, 'rb') as fh:
+        fh.seek(offset)
+        return int(fh.read(16), 16)
+
+
+def sync_chain(source, replica, dry_run=False):
+    if not os.path.exists(replica):
+        open(replica, 'wb').close()
+        if os.path.exists(checksum_filename(replica)):
+            os.remove(checksum_filename(replica))  # left over from an earlier replica
+    common, source_blocks, replica_blocks = divergence(source, replica)
+    result = {'common': common, 'copied': 0, 'bytes': 0, 'fork': None}
+    if common < len(replica_blocks):
+        result['fork'] = common
+        if common < len(source_blocks):
+            result['source_index'] = _index_at(source, source_blocks[common][0])
+        else:
+            result['source_index'] = None  # the replica is ahead of the source
+        result['replica_index'] = _index_at(replica, replica_blocks[common][0])
+        return result
+    # copying starts just past the last block the two have in common; a partly written block at
+    # the end of the source is not in source_blocks, so it is left for a later sync
+    start = source_blocks[common - 1][0] + source_blocks[common - 1][1] if common else 0
+    end = source_blocks[-1][0] + source_blocks[-1][1] if source_blocks else 0
+    result['copied'], result['bytes'] = len(source_blocks) - common, end - start
+    if dry_run:
+        return result
+    with open(replica, 'r+b') as fh:
+        if os.fstat(fh.fileno()).st_size > start:
+            fh.truncate(start)  # anything past the last complete block is an unfinished copy
+    if os.path.exists(checksum_filename(replica)):
+        # keep the sidecar records of the common blocks only, so the copied ones follow on from them
+        with open(checksum_filename(replica), 'r+b') as ch:
+            ch.truncate(min(os.path.getsize(checksum_filename(replica)), common * checksum_record.size))
+    records = []
+    with open(source, 'rb') as src, open(replica, 'ab') as dst:
+        for offset, length in source_blocks[common:]:
+            src.seek(offset)
+            data = src.read(length)
+            dst.write(data)
+            records.append(checksum_record.pack(offset, length, zlib.crc32(data)))
+    if os.path.exists(checksum_filename(replica)):
+        with open(checksum_filename(replica), 'ab') as ch:
+            ch.write(b''.join(records))
+    return result
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print('usage: %s <source chain> <replica chain> [--dry-run]' % (sys.argv[0]))
+        sys.exit(1)
+    result = sync_chain(sys.argv[1], sys.argv[2], '--dry-run' in sys.argv)
+    if result['fork'] is not None:
+        print('*** WARNING *** Replica has forked at position %i: source block %s, replica block %s. Nothing copied.' % (result['fork'], result['source_index'], result['replica_index']))
+        sys.exit(1)
+    print('%i block(s) in common, %i block(s) (%i bytes) %s' % (result['common'], result['copied'], result['bytes'], 'to copy' if '--dry-run' in sys.argv else 'copied'))
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+'''
+A column-oriented, read-only view of a Naughty/Nice chain file.
+
+A ChainTable keeps the header fields of all blocks in parallel array.array columns, the previous
+hashes, data hashes and signatures in one contiguous bytearray each, and the documents as
+(type, length, file offset) references into the chain file. Loading a chain this way allocates a
+handful of large buffers however many blocks there are; a Block() is only built when a block is
+asked for, and its documents are read from the file at that point. (NumPy would do as well for the
+columns, but is not a dependency of this code, so the standard library's array module is used.)
+
+    ChainTable(<filename>) - loads the chain (a header-only scan, documents are skipped).
+
+    len(table), table[i], iteration - the number of blocks, the block at position i (built on
+    demand) and every block in order.
+
+    column(name) - the array holding a header field: index, nonce, pid, rid, doc_count, score, sign,
+    month, day, hour, minute, second, offset or length (the block's place in the file).
+
+    as_chain() - a Chain() whose blocks are this table, so verify_chain() and the other Chain
+    functions work on it without building all the blocks up front.
+
+    verify(public_key, <beginning hash>, <audit>) - shorthand for as_chain().verify_chain().
+'''
+
+from array import array
+import sys
+
+from naughty_nice import Block, Chain, Document, iter_headers
+
+columns = {'index': 'Q', 'nonce': 'Q', 'pid': 'Q', 'rid': 'Q', 'doc_count': 'B', 'score': 'I', 'sign': 'B', 'month': 'B', 'day': 'B', 'hour': 'B', 'minute': 'B', 'second': 'B', 'offset': 'Q', 'length': 'Q'}
+
+
+class ChainTable():
+    def __init__(self, filename=None):
+        if filename is None:
+            filename = 'blockchain.dat'
+        self.filename = filename
+        self.columns = {name: array(code) for name, code in columns.items()}
+        self.previous_hashes = bytearray()
+        self.hashes = bytearray()
+        self.sigs = bytearray()
+        self.first_document = array('Q')  # position in the document columns of each block's first document
+        self.document_type = array('B')
+        self.document_length = array('Q')
+        self.document_offset = array('Q')
+        self._fh = None
+        self._cached = (None, None)  # the last block built, as (position, block)
+        for h in iter_headers(filename, signatures=True):
+            for name, column in self.columns.items():
+                column.append(h[name])
+            self.previous_hashes += h['hashes'][:32]  # raw bytes, so a damaged byte keeps its 32-byte slot
+            self.hashes += h['hashes'][32:]
+            self.sigs += h['sig']
+            self.first_document.append(len(self.document_type))
+            for t, length, offset in h['documents']:
+                self.document_type.append(t)
+                self.document_length.append(length)
+                self.document_offset.append(offset)
+        self.first_document.append(len(self.document_type))
+
+    def column(self, name):
+        return self.columns[name]
+
+    def __len__(self):
+        return len(self.columns['index'])
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self[position]
+
+    def __getitem__(self, position):
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError('block position out of range')
+        if self._cached[0] == position:
+            return self._cached[1]
+        b = Block(load=True)
+        for name in ('index', 'nonce', 'pid', 'rid', 'doc_count', 'score', 'sign', 'month', 'day', 'hour', 'minute', 'second'):
+            setattr(b, name, self.columns[name][position])
+        if self._fh is None:
+            self._fh = open(self.filename, 'rb')
+        for n in range(self.first_document[position], self.first_document[position + 1]):
+            self._fh.seek(self.document_offset[n])
+            b.data.append(Document(self.document_type[n], self.document_length[n], self._fh.read(self.document_length[n])))
+        b.previous_hash = str(bytes(self.previous_hashes[position * 32:(position + 1) * 32]))[2:-1]
+        b.hash = str(bytes(self.hashes[position * 32:(position + 1) * 32]))[2:-1]
+        b.sig = bytes(self.sigs[position * 344:(position + 1) * 344])
+        self._cached = (position, b)
+        return b
+
+    def as_chain(self):
+        c = Chain.__new__(Chain)  # no genesis block and no loading: the table is the chain
+        c.blocks = self
+        if len(self):
+            c.index = self.columns['index'][-1]
+            c.initial_index = self.columns['index'][0]
+        return c
+
+    def verify(self, publickey, previous_hash=None, audit=False):
+        return self.as_chain().verify_chain(publickey, previous_hash, audit)
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+
+if __name__ == '__main__':
+    from Crypto.PublicKey import RSA
+    if len(sys.argv) < 3:
+        print('usage: %s <chain file> <public key> [beginning hash]' % (sys.argv[0]))
+        sys.exit(1)
+    table = ChainTable(sys.argv[1])
+    with open(sys.argv[2], 'rb') as fh:
+        key = RSA.importKey(fh.read())
+    print('%i blocks, verify: %s' % (len(table), table.verify(key, sys.argv[3] if len(sys.argv) > 3 else None)))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+'''
+Scans Naughty/Nice chains for crafted MD5 collision blocks.
+
+Identical-prefix MD5 collisions are made of consecutive 64-byte MD5 blocks whose two versions differ
+by a fixed pattern and leave MD5 in the same internal state. Given one version of such a pair, the
+other is found by applying the pattern, so every 64-byte-aligned pair of MD5 blocks in a block's
+block_data() can be tested exactly: if applying a pattern does not change the MD5 state after the
+pair, the pair is a collision block and somebody crafted it. The patterns checked are:
+
+    unicoll  - byte 9 of the first MD5 block +1 and byte 9 of the second -1, or the other way round
+               (the attack used on block 129459)
+    fastcoll - the Wang/FastColl message differences: bit 31 of words 4 and 14 flipped in both MD5
+               blocks and 2^15 added to word 11 of one block and subtracted from the other
+
+scan_block(block) - returns (offset, pattern) for every collision found in block_data(), offset
+being the start of the first MD5 block of the pair. scan_data(data) does the same for any bytes
+that are hashed from the beginning.
+
+scan_chain(<filename>) - streams a chain file and yields (block index, findings) for every block
+with at least one finding.
+
+scan_files(filenames, <processes>) - scans several chain files at once on a process pool and
+yields (filename, [(block index, findings), ...]) as each file completes.
+'''
+
+import multiprocessing
+import struct
+import sys
+from Crypto.Hash import MD5
+
+from naughty_nice import iter_blocks
+
+_words = struct.Struct('<16I')
+
+
+def _add_to_words(chunk, deltas):
+    words = list(_words.unpack(chunk))
+    for w, d in deltas.items():
+        words[w] = (words[w] + d) & 0xFFFFFFFF
+    return _words.pack(*words)
+
+
+def _add_to_byte(chunk, offset, delta):
+    if not 0 <= chunk[offset] + delta <= 255:
+        return None
+    chunk = bytearray(chunk)
+    chunk[offset] += delta
+    return bytes(chunk)
+
+
+def _variants(pair):
+    # the other half of a collision for each pattern, or None where a pattern cannot apply
+    first, second = pair[:64], pair[64:]
+    for sign in (1, -1):
+        a, b = _add_to_byte(first, 9, sign), _add_to_byte(second, 9, -sign)
+        yield 'unicoll', (a + b) if a is not None and b is not None else None
+        yield 'fastcoll', _add_to_words(first, {4: 2**31, 11: sign * 2**15, 14: 2**31}) + _add_to_words(second, {4: 2**31, 11: -sign * 2**15, 14: 2**31})
+
+
+def scan_data(data):
+    findings = []
+    hash_obj = MD5.new()
+    for start in range(0, len(data) - 127, 64):
+        pair = data[start:start + 128]
+        original = hash_obj.copy()
+        original.update(pair)
+        original = original.digest()
+        for pattern, variant in _variants(pair):
+            if variant is None:
+                continue
+            h = hash_obj.copy()
+            h.update(variant)
+            if h.digest() == original:
+                findings.append((start, pattern))
+                break
+        hash_obj.update(pair[:64])
+    return findings
+
+
+def scan_block(block):
+    return scan_data(block.block_data())
+
+
+def scan_chain(filename=None):
+    for offset, block in iter_blocks(filename):
+        findings = scan_block(block)
+        if findings:
+            yield block.index, findings
+
+
+def _scan_file(filename):
+    return filename, list(scan_chain(filename))
+
+
+def scan_files(filenames, processes=None):
+    with multiprocessing.Pool(processes) as pool:
+        for result in pool.imap_unordered(_scan_file, filenames):
+            yield result
+
+
+if __name__ == '__main__':
+    filenames = sys.argv[1:] or ['blockchain.dat']
+    for filename, suspects in scan_files(filenames):
+        for index, findings in suspects:
+            for offset, pattern in findings:
+                print('%s: block %i has a %s collision block at offset %i' % (filename, index, pattern, offset))
+        print('%s: %i suspicious block(s)' % (filename, len(suspects)))
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+'''
+Finds Naughty/Nice blocks by digest without loading and hashing the whole chain.
+
+A DigestIndex is a small SQLite database (by default <chain file>.digests) mapping the SHA256 of
+each block's block_data_signed() and its full_hash() (the MD5 the next block stores as its
+previous_hash) to the block index and the byte offset of the block in the chain file.
+
+    DigestIndex(chain_filename, <filename>) - opens (or creates) the index for a chain file.
+
+    update() - indexes every block past the last indexed one, in a single streaming pass. On a new
+    index this builds it; afterwards it only reads the blocks appended since.
+
+    add(block, offset) - indexes one block written at offset, e.g. straight after
+    Chain.append_a_block().
+
+    find_sha256(digest) / find_full_hash(digest) - return (block index, offset) or None.
+
+    load(offset) - reads the block stored at offset in the chain file.
+
+    digests() - (offset, length, SHA256) of every indexed block, in chain order.
+'''
+
+import sqlite3
+import sys
+from Crypto.Hash import SHA256
+
+from naughty_nice import iter_blocks
+
+
+class DigestIndex():
+    def __init__(self, chain_filename, filename=None):
+        if filename is None:
+            filename = chain_filename + '.digests'
+        self.chain_filename = chain_filename
+        self.db = sqlite3.connect(filename)
+        self.db.execute('CREATE TABLE IF NOT EXISTS blocks (offset INTEGER PRIMARY KEY, length INTEGER, block_index INTEGER, sha256 TEXT, full_hash TEXT)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS blocks_sha256 ON blocks (sha256)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS blocks_full_hash ON blocks (full_hash)')
+
+    def _insert(self, block, offset):
+        data = block.block_data_signed()
+        self.db.execute('INSERT OR REPLACE INTO blocks VALUES (?, ?, ?, ?, ?)', (offset, len(data), block.index, SHA256.new(data).hexdigest(), block.full_hash()))
+
+    def add(self, block, offset):
+        self._insert(block, offset)
+        self.db.commit()
+
+    def update(self):
+        count = 0
+        row = self.db.execute('SELECT offset + length FROM blocks ORDER BY offset DESC LIMIT 1').fetchone()
+        for offset, block in iter_blocks(self.chain_filename, row[0] if row else 0):
+            self._insert(block, offset)
+            count += 1
+        self.db.commit()
+        return count
+
+    def _find(self, column, digest):
+        row = self.db.execute('SELECT block_index, offset FROM blocks WHERE %s = ?' % (column), (digest.lower(),)).fetchone()
+        return tuple(row) if row else None
+
+    def find_sha256(self, digest):
+        return self._find('sha256', digest)
+
+    def find_full_hash(self, digest):
+        return self._find('full_hash', digest)
+
+    def load(self, offset):
+        for o, block in iter_blocks(self.chain_filename, offset):
+            return block
+
+    def digests(self):
+        return self.db.execute('SELECT offset, length, sha256 FROM blocks ORDER BY offset').fetchall()
+
+    def close(self):
+        self.db.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('usage: %s <chain file> [digest]' % (sys.argv[0]))
+        sys.exit(1)
+    index = DigestIndex(sys.argv[1])
+    print('%i block(s) indexed' % (index.update()))
+    for digest in sys.argv[2:]:
+        found = index.find_sha256(digest) if len(digest) == 64 else index.find_full_hash(digest)
+        if found is None:
+            print('%s: not found' % (digest))
+        else:
+            print('%s: block %i at offset %i' % (digest, found[0], found[1]))
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+'''
+Follows a Naughty/Nice chain file as another process appends to it, like tail -f.
+
+The file is polled for new bytes. As soon as a block is complete it is parsed and put through the
+same checks as verify_chain() (types, index, link to the previous block's full hash, signature), so
+watching a live chain costs the new blocks only, never a reload of the whole file.
+
+    follow(filename, public_key, <beginning hash>, <existing>, <interval>, <idle>) - a generator
+    yielding a dictionary for every block as it arrives: its 'position' in the chain, file
+    'offset', 'index', the 'block' itself and the verify_chain(audit=True) 'failures' for it (an
+    empty list for a good block). With existing (the default) the blocks already in the file are
+    checked and yielded first; otherwise following starts at the end of the file, linked to the
+    last block there. The file is polled every interval seconds (default 1); with idle set, the
+    generator ends once no new block has arrived for that many seconds. Data that cannot be
+    parsed, or a file that shrinks, ends it with a final dictionary holding a 'parse' or
+    'truncated' failure and no block.
+'''
+
+import io
+import os
+import sys
+import time
+
+from Crypto.PublicKey import RSA
+
+from naughty_nice import Block, Chain, genesis_block_fake_hash, iter_headers
+
+
+def _block_length(data, start):
+    # the length of the block at data[start:], or None if it is not all there yet
+    if len(data) < start + 74:
+        return None
+    length = 74
+    for n in range(int(data[start + 64:start + 65], 10)):
+        if len(data) < start + length + 10:
+            return None
+        length += 10 + int(data[start + length + 2:start + length + 10], 16)
+    length += 418
+    return length if len(data) >= start + length else None
+
+
+def _verify(block, position, expected_index, previous_hash, publickey):
+    c = Chain.__new__(Chain)  # a chain of just this block, checked against the one before it
+    c.blocks = [block]
+    c.initial_index = block.index if expected_index is None else expected_index
+    failures = c.verify_chain(publickey, previous_hash, audit=True)
+    for f in failures:
+        f['position'] = position
+    return failures
+
+
+def follow(filename, publickey, previous_hash=None, existing=True, interval=1.0, idle=None):
+    if previous_hash is None:
+        previous_hash = genesis_block_fake_hash
+    offset, position, expected_index = 0, 0, None
+    if not existing:
+        last = None
+        for h in iter_headers(filename):
+            last = h
+            position += 1
+        if last is not None:
+            with open(filename, 'rb') as fh:
+                fh.seek(last['offset'])
+                previous_hash = Block(load=True).load_a_block(fh).full_hash()
+            offset, expected_index = last['offset'] + last['length'], last['index'] + 1
+    with open(filename, 'rb') as fh:
+        fh.seek(offset)
+        pending, start = b'', 0  # bytes read but not yet parsed are pending[start:]
+        waited = 0.0
+        while(1):
+            try:
+                length = _block_length(pending, start)
+                if length is not None:
+                    block = Block(load=True).load_a_block(io.BytesIO(pending[start:start + length]))
+            except ValueError:
+                yield {'position': position, 'offset': offset, 'index': None, 'block': None, 'failures': [{'check': 'parse', 'position': position, 'index': None}]}
+                return
+            if length is None:
+                data = fh.read(1 << 20)
+                if data:
+                    pending, start = pending[start:] + data, 0
+                    continue
+                if os.fstat(fh.fileno()).st_size < fh.tell():
+                    yield {'position': position, 'offset': offset, 'index': None, 'block': None, 'failures': [{'check': 'truncated', 'position': position, 'index': None}]}
+                    return
+                if idle is not None and waited >= idle:
+                    return
+                time.sleep(interval)
+                waited += interval
+                continue
+            waited = 0.0
+            failures = _verify(block, position, expected_index, previous_hash, publickey)
+            yield {'position': position, 'offset': offset, 'index': block.index, 'block': block, 'failures': failures}
+            # the next block is checked against this one, as in verify_chain(audit=True)
+            previous_hash = block.full_hash()
+            expected_index = block.index + 1
+            offset += length
+            position += 1
+            start += length
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print('usage: %s <chain file> <public key> [beginning hash] [--new]' % (sys.argv[0]))
+        sys.exit(1)
+    args = [a for a in sys.argv[1:] if a != '--new']
+    with open(args[1], 'rb') as fh:
+        key = RSA.importKey(fh.read())
+    try:
+        for result in follow(args[0], key, args[2] if len(args) > 2 else None, existing='--new' not in sys.argv):
+            if result['block'] is None:
+                print('Stopped at offset %i: %s' % (result['offset'], result['failures'][0]['check']))
+            elif result['failures']:
+                print('Block %i at offset %i: FAILED %s' % (result['index'], result['offset'], ', '.join(f['check'] for f in result['failures'])))
+            else:
+                print('Block %i at offset %i: OK' % (result['index'], result['offset']))
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        pass
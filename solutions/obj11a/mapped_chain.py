@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+'''
+Memory-mapped access to a Naughty/Nice chain file, one block at a time and one field at a time.
+
+MappedBlocks maps a chain file with mmap and finds where each block starts with a quick offset scan
+(only the document counts and lengths are parsed). Indexing it returns a BlockProxy, a Block()
+whose fields are properties that parse the mapped bytes when read: opening a huge chain costs the
+offset scan only, and fields or documents that are never looked at are never copied out of the
+file. block_data() and block_data_signed() are slices of the mapping, so hashing and signature
+checks see exactly the bytes on disk. Proxies are read-only; load() turns one into an ordinary Block.
+
+Chain(load=True, filename=..., lazy=True) uses a MappedBlocks as its blocks, so verify_chain() and
+the other Chain functions work unchanged. Blocks added with add_block() are kept in memory after
+the mapped ones.
+
+    MappedBlocks(<filename>) - maps the chain file and scans it for block offsets.
+
+    len(blocks), blocks[i], iteration, append(block), offset(i), close()
+'''
+
+from array import array
+import io
+import mmap
+import sys
+
+from naughty_nice import Block, Document
+
+
+def _field(start, length, base=16):
+    def get(self):
+        o = self._offset + start
+        return int(self._map[o:o + length], base)
+    return property(get)
+
+
+def _tail_field(start, length):
+    def get(self):
+        o = self._end - 418 + start
+        return int(self._map[o:o + length])
+    return property(get)
+
+
+class BlockProxy(Block):
+    __slots__ = ('_map', '_offset', '_end')
+
+    def __init__(self, mapped, offset, end):
+        self._map = mapped
+        self._offset = offset
+        self._end = end
+
+    index = _field(0, 16)
+    nonce = _field(16, 16)
+    pid = _field(32, 16)
+    rid = _field(48, 16)
+    doc_count = _field(64, 1, 10)
+    score = _field(65, 8)
+    sign = _field(73, 1, 10)
+    month = _tail_field(0, 2)
+    day = _tail_field(2, 2)
+    hour = _tail_field(4, 2)
+    minute = _tail_field(6, 2)
+    second = _tail_field(8, 2)
+
+    @property
+    def data(self):
+        documents = []
+        o = self._offset + 74
+        for n in range(self.doc_count):
+            length = int(self._map[o + 2:o + 10], 16)
+            documents.append(Document(int(self._map[o:o + 2], 16), length, self._map[o + 10:o + 10 + length]))
+            o += 10 + length
+        return documents
+
+    @property
+    def previous_hash(self):
+        return str(self._map[self._end - 408:self._end - 376])[2:-1]
+
+    @property
+    def hash(self):
+        return str(self._map[self._end - 376:self._end - 344])[2:-1]
+
+    @property
+    def sig(self):
+        return self._map[self._end - 344:self._end]
+
+    def block_data(self):
+        return self._map[self._offset:self._end - 376]
+
+    def block_data_signed(self):
+        return self._map[self._offset:self._end]
+
+    def load(self):
+        return Block(load=True).load_a_block(io.BytesIO(self.block_data_signed()))
+
+
+class MappedBlocks():
+    def __init__(self, filename=None):
+        if filename is None:
+            filename = 'blockchain.dat'
+        self._file = open(filename, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.offsets = array('Q')
+        self.added = []
+        o, m = 0, self._map
+        try:
+            while o + 74 <= len(m):
+                p = o + 74
+                for n in range(int(m[o + 64:o + 65], 10)):
+                    p += 10 + int(m[p + 2:p + 10], 16)
+                p += 418
+                if p > len(m):
+                    break
+                self.offsets.append(o)
+                o = p
+        except ValueError:
+            pass  # unparsable data ends the chain, as in load_chain()
+        self.offsets.append(o)
+
+    def __len__(self):
+        return len(self.offsets) - 1 + len(self.added)
+
+    def offset(self, position):
+        return self.offsets[position]
+
+    def __getitem__(self, position):
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError('block position out of range')
+        if position >= len(self.offsets) - 1:
+            return self.added[position - len(self.offsets) + 1]
+        return BlockProxy(self._map, self.offsets[position], self.offsets[position + 1])
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self[position]
+
+    def append(self, block):
+        self.added.append(block)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+if __name__ == '__main__':
+    blocks = MappedBlocks(sys.argv[1] if len(sys.argv) > 1 else None)
+    for b in blocks:
+        print('Block %i at offset %i: pid %016.016x, %i document(s)' % (b.index, b._offset, b.pid, b.doc_count))
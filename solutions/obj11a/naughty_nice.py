@@ -75,18 +75,30 @@ The Block() class MUST supply the following functions, used by the Chain() class
     addition to the block chain. This function DOES NOT verify blocks. This function throws a
     Value_Error exception when it either encounters the end of the file or unparsable data.
 
-The Naughty/Nice Block() class also defines a utility function:
+The Naughty/Nice Block() class also defines these utility functions:
+
+    cache_midstates(<enable>, <stride>) - keeps the MD5 state every stride bytes (default 4096, always
+    a multiple of the 64-byte MD5 block size) of the signed block data, so that after editing a few
+    bytes of a block full_hash() only rehashes from the cached state in front of the first changed
+    byte. Useful when repeatedly tampering with (or repairing) a block that carries large documents.
+    Call cache_midstates(False) to drop the cache. The cache is not carried over when a block is
+    pickled (to hand it to a process pool, say) or copied.
 
     dump_doc([document number]) - this will dump the indicated supporting document to a file named
     as <block_index>.<data_type_extension>. Note: this function will overwrite any existing file
     with that name, so if there are multiple documents (there can be up to 9) of the same type
     affixed to a record, it is the responsibility of the calling process to rename them as appropriate.
 
+    field_offsets() - returns a (name, offset, length) tuple for every field of the signed block data,
+    header fields and documents alike, so that a byte offset in a saved block can be traced back
+    to the field it belongs to.
+
 The Chain() class provides the following functions:
 
     add_block([block_data]) - passes a block_data dictionary to the Block() initialization code.
     This function, being "block-agnostic" simply passes the block_data along. It is up to the Block()
-    initialization code to validate this data.
+    initialization code to validate this data. The documents are stored as Document() records,
+    which can be read and written like the dictionaries they are given as.
 
     verify_chain([public_key], <beginning hash>) - steps through every block in the chain and
     verifies that the data in each block is of the correct type, that the block index is correct,
@@ -98,16 +110,104 @@ The Chain() class provides the following functions:
     block, you'll need to provide a value for the previous block's hash for this function to
     work.
 
+    verify_chain([public_key], <beginning hash>, audit=True) - the same checks, but the walk does not
+    stop at the first bad block. Each block is checked against the hash and index of the block just
+    before it, and a list of every failure is returned (an empty list means the chain is valid). Each
+    failure is a dictionary holding the 'check' that failed ('type', 'index', 'link' or 'signature'),
+    the 'position' of the block in the chain and its claimed 'index'. Nothing is printed. A block
+    altered after signing usually shows up twice: a 'signature' failure on the block itself and a
+    'link' failure on the block after it, whose previous hash no longer matches. Blocks further on
+    are not reported.
+
     save_a_block(index, <filename>) - saves the block at index to the filename provided, or to
     "block.dat" if no filename is given.
 
     save_chain(<filename>) - saves the chain to the filename provided, or to "blockchain.dat" if
-    no filename is given.
+    no filename is given. A checksum sidecar named <filename>.crc is written alongside it, holding
+    the offset, length and CRC32 of every block. Both are written to temporary files that then
+    replace the old ones, so a chain can be saved over the file it was loaded (or mapped) from.
+
+    append_a_block(index, <filename>) - appends the block at index to the end of an existing chain
+    file (default "blockchain.dat") and adds its record to the checksum sidecar. Returns the file
+    offset the block was written at. If the chain's ledger attribute is set (see score_ledger.py),
+    the block is also applied to that ledger, which is not saved until its save() or update().
+
+    load_chain(<filename>, <offset>) - loads a chain from the filename provided, or from "blockchain.dat" if
+    no filename is given, starting at the given byte offset (the beginning of the file by default).
+    This returns the count of blocks loaded. This DOES NOT verify that the data loaded is a valid
+    blockchain. It is recommended to call verify_chain() immediately after loading a new chain.
+
+    save_snapshot(<filename>) - appends a snapshot of the chain, as saved in filename, to
+    <filename>.snap: the index, full hash and file offset of the last block, the index of the file's
+    first block, the file offset just past the last block and a few running totals (blocks,
+    documents, Nice and Naughty records). Setting snapshot_every to N makes append_a_block() take a
+    snapshot after every block whose index is a multiple of N. save_chain() empties the snapshot
+    file, since it rewrites the chain.
+
+    save_segments(directory, <blocks_per_segment>) - saves the chain as numbered segment files of
+    blocks_per_segment blocks each (100000 by default) in directory, along with a manifest.json
+    that records each segment's file, first block index, starting previous hash and block count.
+    append_to_segments(index, directory) appends the block at index to the last segment, starting
+    a new one when it is full, so a full segment is never written to again. load_segments(directory,
+    <segments>, <processes>) loads all (or the listed) segments, in parallel if asked to; passing
+    a segment directory to load_chain() or Chain(load=True, filename=...) loads all of it.
+
+    A chain can also be kept in an SQLite database (see sqlite_store.py): load_chain(), save_chain()
+    and append_a_block() use it for any existing SQLite file, or a new file named *.db, *.sqlite or
+    *.sqlite3. For such files append_a_block() returns the block's position instead of an offset,
+    and no checksum sidecar is written.
+
+    Chain(load=True, filename=<filename>, lazy=True) maps the chain file into memory instead of
+    loading it, and its blocks are read-only proxies that only parse the fields that are used (see
+    mapped_chain.py). Opening even a very large chain this way is almost instant.
+
+    Compressed chain archives written by chain_archive.py are also recognized by load_chain() (and
+    so by Chain(load=True, filename=...)) and read transparently.
+
+    Chain(load=True, filename=<filename>, snapshot=True) starts from the latest snapshot of the file
+    whose last block is still there (same offset, index and full hash) and only loads the blocks
+    after it, which is enough to append new blocks (index and last_hash_value are restored). The
+    snapshot is kept in the chain's snapshot attribute; pass its 'last_hash_value' as the beginning
+    hash to verify_chain(). Such a chain cannot be saved with save_chain(), which raises ValueError
+    rather than write out the tail alone; new blocks go to the file with append_a_block().
+
+The module also provides iter_blocks(<filename>, <offset>), a generator yielding (file offset, block)
+for every block of a chain file (default "blockchain.dat") from the given byte offset onward,
+without holding the whole chain in memory. Like load_chain() it does not verify anything.
+
+iter_headers(<filename>, <offset>, <signatures>) works the same way but only reads the header fields
+(as a dictionary) and seeks over the documents and, unless signatures is set, the signature,
+which makes it much cheaper to scan a chain when the documents are not needed.
+
+For segmented chains, verify_segments(directory, [public_key], <processes>) runs verify_chain() in audit
+mode on every segment in parallel and also checks the links between segments; it returns the
+failures of all segments, each tagged with its 'segment' number. export_segments(directory,
+<filename>) writes the segments back out as one ordinary chain file, copying segments in parallel,
+along with its checksum sidecar.
+
+The module also provides quick_check(<filename>), a fast first pass over a saved chain that only
+compares the CRC32 checksums in the sidecar. It returns the blocks that look damaged or truncated
+(an empty list if none do) so that the much slower verify_chain() can be pointed at them. A chain
+without a sidecar is reported as one stretch of unchecked data. It can be run from the command line
+as "python3 quick_check.py <filename>".
 
-    load_chain(<filename>) - loads a chain from the filename provided, or from "blockchain.dat" if
-    no filename is given. This returns the count of blocks loaded. This DOES NOT verify that the
-    data loaded is a valid blockchain. It is recommended to call verify_chain() immediately after
-    loading a new chain.
+From the command line, "python3 -m naughty_nice <command>" (or "python3 naughty_nice.py <command>")
+offers:
+
+    verify <chain> <public key> [beginning hash] - verify_chain() in audit mode, listing every failure.
+    ls <chain> - one line per block: index, offset, pid, Nice/Naughty and score, documents, timestamp.
+    get <chain> <index> - prints the block with that index.
+    dump <chain> <index> [document] - dump_doc() for one document of the block, or all of them.
+    stats <chain> - block, document and pid counts and the Nice and Naughty totals.
+
+With no command it verifies blockchain.dat against official_public.pem, as it always has. Only the
+commands that hash or check signatures import the Crypto package, so the others (which also only
+read block headers where they can) start quickly.
+
+block_offsets(<filename>) returns the (offset, length) of every block in a chain file, taken from
+the checksum sidecar where it can be (and where its last record checks out against the file) and
+from a header scan for the rest, so that single blocks
+can be read straight from the file (chain_sync.py uses it to compare chains block by block).
 
 An overview of how we process the Official Naughty/Nice Blockchain:
 
@@ -152,12 +252,36 @@ is contained in the file official_public.pem.
 '''
 
 import random
-from Crypto.Hash import MD5, SHA256
-from Crypto.PublicKey import RSA
-from Crypto.Signature import PKCS1_v1_5
 from base64 import b64encode, b64decode
 import binascii
+import json
+import os
+import struct
+import sys
 import time
+import zlib
+
+# MD5, SHA256, RSA and PKCS1_v1_5 (from the Crypto package) are imported by _crypto() the first
+# time something is hashed, signed or verified, so that importing this module stays quick for
+# work that never needs them (listing a chain, say)
+_crypto_names = ('MD5', 'SHA256', 'RSA', 'PKCS1_v1_5')
+
+
+def _crypto():
+    global MD5, SHA256, RSA, PKCS1_v1_5
+    if 'MD5' not in globals():
+        from Crypto.Hash import MD5, SHA256
+        from Crypto.PublicKey import RSA
+        from Crypto.Signature import PKCS1_v1_5
+
+
+def __getattr__(name):
+    # naughty_nice.MD5 and friends still work from outside, importing the Crypto modules on demand
+    if name in _crypto_names:
+        _crypto()
+        return globals()[name]
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
+
 
 genesis_block_fake_hash = '00000000000000000000000000000000'
 
@@ -167,7 +291,55 @@ data_extension = {1:'txt', 2:'jpg', 3:'bmp', 4:'gif', 5:'pdf', 6:'docx', 7:'pptx
 Naughty = 0
 Nice = 1
 
+# first bytes of a compressed chain archive (see chain_archive.py)
+archive_magic = b'NNA1'
+
+# one record per block in the <chain file>.crc sidecar: byte offset, length, CRC32 of the signed block
+checksum_record = struct.Struct('>QII')
+
+_unset = object()
+
+
+class Document():
+    # One supporting document of a block. Slotted to keep million-block chains small, but it can
+    # still be used like the {'type': ..., 'length': ..., 'data': ...} dictionary it replaces.
+    __slots__ = ('type', 'length', 'data')
+
+    def __init__(self, type, length, data):
+        self.type = type
+        self.length = length
+        self.data = data
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def keys(self):
+        return self.__slots__
+
+    def __eq__(self, other):
+        if isinstance(other, Document):
+            return (self.type, self.length, self.data) == (other.type, other.length, other.data)
+        elif isinstance(other, dict):
+            return dict(self) == other
+        else:
+            return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
 class Block():
+    __slots__ = ('index', 'nonce', 'pid', 'rid', 'doc_count', 'score', 'sign', 'data', 'month', 'day', 'hour', 'minute', 'second', 'previous_hash', 'hash', 'sig', '_midstates', '_midstate_pieces', '_midstate_stride')
+
     def __init__(self, index=None, block_data=None, previous_hash=None, load=False, genesis=False):
         if(genesis == True):
             return None
@@ -180,7 +352,7 @@ class Block():
                         self.nonce = 0 # genesis block
                     else:
                         self.nonce = random.randrange(0xFFFFFFFFFFFFFFFF)
-                    self.data = block_data['documents']
+                    self.data = [Document(d['type'], d['length'], d['data']) for d in block_data['documents']]
                     self.previous_hash = previous_hash
                     self.doc_count = len(self.data)
                     self.pid = block_data['pid']
@@ -197,9 +369,27 @@ class Block():
                 else:
                     return None
 
+    def __getstate__(self):
+        # pickling and copying leave out the MD5 midstate cache, whose hash objects cannot be
+        # pickled or deep-copied (and must not be shared by a copy); call cache_midstates() again
+        # on the copy if it is wanted
+        slots = {}
+        for cls in type(self).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                if not name.startswith('_midstate') and hasattr(self, name):
+                    slots[name] = getattr(self, name)
+        return getattr(self, '__dict__', None), slots
+
+    def _content(self):
+        # leading-underscore attributes are caches (e.g. MD5 midstates), not block content; the
+        # __dict__ part only exists for subclasses that do not declare __slots__
+        values = [getattr(self, name, _unset) for name in Block.__slots__ if not name.startswith('_')]
+        extra = {k: v for k, v in getattr(self, '__dict__', {}).items() if not k.startswith('_')}
+        return values, extra
+
     def __eq__(self, other):
-        if isinstance(other, self.__class__):
-            return self.__dict__ == other.__dict__
+        if isinstance(other, Block):
+            return self._content() == other._content()
         else:
             return False
 
@@ -229,17 +419,60 @@ class Block():
         return(s)
 
     def full_hash(self):
+        if getattr(self, '_midstates', None) is not None:
+            return self._cached_full_hash()
+        _crypto()
         hash_obj = MD5.new()
         hash_obj.update(self.block_data_signed())
         return hash_obj.hexdigest()
 
+    def cache_midstates(self, enable=True, stride=4096):
+        # Keep a copy of the MD5 state every stride bytes (a multiple of the 64-byte MD5 block
+        # size) of block_data_signed(). Once enabled, full_hash() only rehashes from the cached
+        # state just before the first changed byte.
+        if stride <= 0 or stride % 64 != 0:
+            raise ValueError('stride must be a positive multiple of 64')
+        self._midstates = None
+        self._midstate_pieces = None
+        if enable:
+            _crypto()
+            self._midstates = [MD5.new()]
+            self._midstate_pieces = []
+            self._midstate_stride = stride
+            self._cached_full_hash()
+
+    def _cached_full_hash(self):
+        pieces = self._signed_pieces()
+        stride = self._midstate_stride
+        start = min(_unchanged_prefix(self._midstate_pieces, pieces) // stride, len(self._midstates) - 1)
+        # a new list rather than trimming the old one, which a copy.copy() of the block shares
+        self._midstates = self._midstates[:start + 1]
+        hash_obj = self._midstates[start].copy()
+        offset, suffix = 0, []
+        for p in pieces:
+            if offset + len(p) > start * stride:
+                suffix.append(p[max(start * stride - offset, 0):])
+            offset += len(p)
+        suffix = b''.join(suffix)
+        for o in range(0, len(suffix) - stride + 1, stride):
+            hash_obj.update(suffix[o:o + stride])
+            self._midstates.append(hash_obj.copy())
+        hash_obj.update(suffix[len(suffix) - len(suffix) % stride:])
+        self._midstate_pieces = pieces
+        return hash_obj.hexdigest()
+
     def hash_n_sign(self):
+        _crypto()
         hash_obj = MD5.new()
         hash_obj.update(self.block_data())
         signer = PKCS1_v1_5.new(private_key)
         return (hash_obj.hexdigest(), b64encode(signer.sign(hash_obj)))
 
     def block_data(self):
+        return b''.join(self._data_pieces())
+
+    def _data_pieces(self):
+        # block_data() in parts, with each document kept as its own bytes object
         s = (str('%016.016x' % (self.index)).encode('utf-8'))
         s += (str('%016.016x' % (self.nonce)).encode('utf-8'))
         s += (str('%016.016x' % (self.pid)).encode('utf-8'))
@@ -247,17 +480,21 @@ class Block():
         s += (str('%1.1i' % (self.doc_count)).encode('utf-8'))
         s += (str(('%08.08x' % (self.score))).encode('utf-8'))
         s += (str('%1.1i' % (self.sign)).encode('utf-8'))
+        pieces = [s]
         for d in self.data:
-            s += (str('%02.02x' % d['type']).encode('utf-8'))
-            s += (str('%08.08x' % d['length']).encode('utf-8'))
-            s += d['data']
-        s += (str('%02.02i' % (self.month)).encode('utf-8'))
+            pieces.append(str('%02.02x' % d['type']).encode('utf-8') + str('%08.08x' % d['length']).encode('utf-8'))
+            pieces.append(d['data'])
+        s = (str('%02.02i' % (self.month)).encode('utf-8'))
         s += (str('%02.02i' % (self.day)).encode('utf-8'))
         s += (str('%02.02i' % (self.hour)).encode('utf-8'))
         s += (str('%02.02i' % (self.minute)).encode('utf-8'))
         s += (str('%02.02i' % (self.second)).encode('utf-8'))
         s += (str(self.previous_hash).encode('utf-8'))
-        return(s)
+        pieces.append(s)
+        return pieces
+
+    def _signed_pieces(self):
+        return self._data_pieces() + [bytes(self.hash.encode('utf-8')), self.sig]
 
     def block_data_signed(self):
         s = self.block_data()
@@ -266,29 +503,38 @@ class Block():
         return(s)
 
     def load_a_block(self, fh):
-        self.index = int(fh.read(16), 16)
-        self.nonce = int(fh.read(16), 16)
-        self.pid = int(fh.read(16), 16)
-        self.rid = int(fh.read(16), 16)
-        self.doc_count = int(fh.read(1), 10)
-        self.score = int(fh.read(8), 16)
-        self.sign = int(fh.read(1), 10)
+        # one read for the fixed header, two per document and one for the timestamp, hashes and
+        # signature. doc_count and sign are single decimal digits, which read the same in hex, so
+        # when every header byte is a hex digit a single int() decodes the whole header. Anything
+        # else (including what int() tolerates in a lone field, such as spaces or a 0x prefix) and
+        # short reads are parsed field by field, exactly as before.
+        head = fh.read(74)
+        if len(head) == 74 and not head.translate(None, b'0123456789abcdefABCDEF') and head[64] < 58 and head[73] < 58:
+            fields = int(head, 16)
+            self.index, self.nonce, self.pid, self.rid = fields >> 232, fields >> 168 & 0xffffffffffffffff, fields >> 104 & 0xffffffffffffffff, fields >> 40 & 0xffffffffffffffff
+            self.doc_count, self.score, self.sign = fields >> 36 & 0xf, fields >> 4 & 0xffffffff, fields & 0xf
+        else:
+            self.index, self.nonce, self.pid, self.rid = [int(head[n:n + 16], 16) for n in range(0, 64, 16)]
+            self.doc_count = int(head[64:65], 10)
+            self.score = int(head[65:73], 16)
+            self.sign = int(head[73:74], 10)
         count = self.doc_count
         while(count > 0):
-            l_data = {}
-            l_data['type'] = int(fh.read(2),16)
-            l_data['length'] = int(fh.read(8), 16)
-            l_data['data'] = fh.read(l_data['length'])
-            self.data.append(l_data)
+            d = fh.read(10)
+            l_length = int(d[2:10], 16)
+            self.data.append(Document(int(d[0:2], 16), l_length, fh.read(l_length)))
             count -= 1
-        self.month = int(fh.read(2))
-        self.day = int(fh.read(2))
-        self.hour = int(fh.read(2))
-        self.minute = int(fh.read(2))
-        self.second = int(fh.read(2))
-        self.previous_hash = str(fh.read(32))[2:-1]
-        self.hash = str(fh.read(32))[2:-1]
-        self.sig = fh.read(344)
+        tail = fh.read(418)
+        if len(tail) >= 74 and tail[0:74].isalnum():
+            t = int(tail[0:10])
+            self.month, self.day, self.hour, self.minute, self.second = t // 100000000, t // 1000000 % 100, t // 10000 % 100, t // 100 % 100, t % 100
+            hashes = tail[10:74].decode('utf-8')
+            self.previous_hash, self.hash = hashes[:32], hashes[32:]
+        else:
+            self.month, self.day, self.hour, self.minute, self.second = [int(tail[n:n + 2]) for n in range(0, 10, 2)]
+            self.previous_hash = str(tail[10:42])[2:-1]
+            self.hash = str(tail[42:74])[2:-1]
+        self.sig = tail[74:418]
         return self
 
     def create_genesis_block(self):
@@ -329,20 +575,79 @@ class Block():
             fh.write(d)
         print('Document dumped as: %s' % (filename))
 
+    def field_offsets(self):
+        # (name, offset, length) of every field in block_data_signed(), in order
+        fields = [('index', 16), ('nonce', 16), ('pid', 16), ('rid', 16), ('doc_count', 1), ('score', 8), ('sign', 1)]
+        for n, d in enumerate(self.data, 1):
+            fields += [('document %i type' % (n), 2), ('document %i length' % (n), 8), ('document %i data' % (n), len(d['data']))]
+        fields += [('month', 2), ('day', 2), ('hour', 2), ('minute', 2), ('second', 2), ('previous_hash', 32), ('hash', 32), ('sig', len(self.sig))]
+        offsets = []
+        offset = 0
+        for name, length in fields:
+            offsets.append((name, offset, length))
+            offset += length
+        return offsets
+
+
+def _unchanged_prefix(old_pieces, new_pieces):
+    # number of leading bytes two lists of byte strings have in common once joined; pieces that
+    # are the very same object (an untouched document) are skipped without being compared
+    offset = 0
+    for a, b in zip(old_pieces, new_pieces):
+        if a is b or a == b:
+            offset += len(a)
+            continue
+        low, n, step = 0, min(len(a), len(b)), 65536
+        while low < n and a[low:low + step] == b[low:low + step]:
+            low += step
+        high = min(low + step, n)
+        while low < high:
+            mid = (low + high + 1) // 2
+            if a[low:mid] == b[low:mid]:
+                low = mid
+            else:
+                high = mid - 1
+        return offset + low
+    return offset
+
 
 class Chain():
     index = 0
     initial_index = 0
     last_hash_value = ''
-    def __init__(self, load=False, filename=None):
+    ledger = None
+    snapshot = None
+    snapshot_every = 0
+    def __init__(self, load=False, filename=None, snapshot=False, lazy=False):
         if not load:
             self.blocks = [Block(genesis=True).create_genesis_block()]
             self.last_hash_value = self.blocks[0].full_hash()
+        elif lazy:
+            from mapped_chain import MappedBlocks
+            self.blocks = MappedBlocks(filename)
+            self.index = self.blocks[-1].index
+            self.initial_index = self.blocks[0].index
+            self.last_hash_value = self.blocks[-1].full_hash()
+        elif snapshot:
+            self.blocks = []
+            self.snapshot = latest_snapshot(filename)
+            if self.snapshot is None:
+                self.load_chain(filename)
+            else:
+                self.load_chain(filename, self.snapshot['offset'])
+            self.index = self.snapshot['index'] if self.snapshot else 0
+            self.initial_index = self.index + 1
+            self.last_hash_value = self.snapshot['last_hash_value'] if self.snapshot else ''
+            if self.blocks:
+                self.index = self.blocks[-1].index
+                self.initial_index = self.blocks[0].index
+                self.last_hash_value = self.blocks[-1].full_hash()
         else:
             self.blocks = []
             self.load_chain(filename)
             self.index = self.blocks[-1].index
             self.initial_index = self.blocks[0].index
+            self.last_hash_value = self.blocks[-1].full_hash()
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
@@ -356,33 +661,58 @@ class Chain():
         self.blocks.append(b)
         self.last_hash_value = b.full_hash()
 
-    def verify_chain(self, publickey, previous_hash=None):
+    def verify_chain(self, publickey, previous_hash=None, audit=False):
         flag = True
+        failures = []
         # unless we're explicitly told what the initial last hash should be, we assume that
         # the initial block will be the genesis block and will have a fixed previous_hash
         if previous_hash is None:
             previous_hash = genesis_block_fake_hash
+        expected_index = self.initial_index
+        _crypto()
         for i in range(0, len(self.blocks)):  # assume Genesis block integrity
             block_no = self.blocks[i].index
             if not self.blocks[i].verify_types():
                 flag = False
-                print(f'\n*** WARNING *** Wrong data type(s) at block {block_no}.')
-            if self.blocks[i].index != i + self.initial_index:
+                failures.append({'check': 'type', 'position': i, 'index': block_no})
+                if not audit:
+                    print(f'\n*** WARNING *** Wrong data type(s) at block {block_no}.')
+            if self.blocks[i].index != expected_index:
                 flag = False
-                print(f'\n*** WARNING *** Wrong block index at what should be block {i + self.initial_index}: {block_no}.')
+                failures.append({'check': 'index', 'position': i, 'index': block_no, 'expected': expected_index})
+                if not audit:
+                    print(f'\n*** WARNING *** Wrong block index at what should be block {expected_index}: {block_no}.')
             if self.blocks[i].previous_hash != previous_hash:
                 flag = False
-                print(f'\n*** WARNING *** Wrong previous hash at block {block_no}.')
+                failures.append({'check': 'link', 'position': i, 'index': block_no, 'expected': previous_hash, 'found': self.blocks[i].previous_hash})
+                if not audit:
+                    print(f'\n*** WARNING *** Wrong previous hash at block {block_no}.')
             hash_obj = MD5.new()
             hash_obj.update(self.blocks[i].block_data())
             signer = PKCS1_v1_5.new(publickey)
-            if signer.verify(hash_obj, b64decode(self.blocks[i].sig)) is False:
+            try:
+                sig_ok = signer.verify(hash_obj, b64decode(self.blocks[i].sig))
+            except (ValueError, TypeError):
+                sig_ok = False
+            if sig_ok is False:
                 flag = False
-                print(f'\n*** WARNING *** Bad signature at block {block_no}.')
-            if flag == False:
+                failures.append({'check': 'signature', 'position': i, 'index': block_no})
+                if not audit:
+                    print(f'\n*** WARNING *** Bad signature at block {block_no}.')
+            if flag == False and not audit:
                 print(f'\n*** WARNING *** Blockchain invalid from block {block_no} onward.\n')
                 return False
+            # in audit mode a failure does not end the walk: the next block is checked against
+            # this block's own hash and index, so the damage is reported where it is (a tampered
+            # block fails its signature, and the block after it fails the link) and not again for
+            # every block further down the chain
             previous_hash = self.blocks[i].full_hash()
+            if isinstance(block_no, int):
+                expected_index = block_no + 1
+            else:
+                expected_index += 1
+        if audit:
+            return failures
         return True
 
     def save_a_block(self, index, filename=None):
@@ -391,20 +721,135 @@ class Chain():
         with open(filename, 'wb') as fh:
             fh.write(self.blocks[index].block_data_signed())
 
+    def append_a_block(self, index, filename=None):
+        if filename is None:
+            filename = 'blockchain.dat'
+        if is_sqlite(filename):
+            from sqlite_store import append_block
+            return append_block(filename, self.blocks[index])
+        with open(filename, 'ab') as fh, open(checksum_filename(filename), 'ab') as ch:
+            offset = fh.tell()
+            data = self.blocks[index].block_data_signed()
+            fh.write(data)
+            ch.write(checksum_record.pack(offset, len(data), zlib.crc32(data)))
+        if self.ledger is not None:
+            self.ledger.apply(self.blocks[index], offset + len(data))
+        if self.snapshot_every and self.blocks[index].index % self.snapshot_every == 0:
+            self.save_snapshot(filename)
+        return offset
+
     def save_chain(self, filename=None):
         if filename is None:
-            filname = 'blockchain.dat'
-        with open(filename, 'wb') as fh:
+            filename = 'blockchain.dat'
+        if self.snapshot is not None:
+            # only the blocks after the snapshot are loaded, so saving would drop the rest of the chain
+            raise ValueError('a chain loaded from a snapshot holds only its tail; use append_a_block()')
+        if is_sqlite(filename):
+            from sqlite_store import save_blocks
+            save_blocks(filename, self.blocks)
+            return
+        if os.path.exists(snapshot_filename(filename)):
+            open(snapshot_filename(filename), 'w').close()  # snapshots of whatever was here before
+        # written beside the file and then put in its place, since the blocks may still be read
+        # from the file being replaced (a lazy chain maps it into memory)
+        with open(filename + '.tmp', 'wb') as fh, open(checksum_filename(filename) + '.tmp', 'wb') as ch:
             i = 0
+            offset = 0
             while(i < len(self.blocks)):
-                fh.write(self.blocks[i].block_data_signed())
+                data = self.blocks[i].block_data_signed()
+                fh.write(data)
+                ch.write(checksum_record.pack(offset, len(data), zlib.crc32(data)))
+                offset += len(data)
                 i += 1
+        os.replace(filename + '.tmp', filename)
+        os.replace(checksum_filename(filename) + '.tmp', checksum_filename(filename))
 
-    def load_chain(self, filename=None):
+    def save_snapshot(self, filename=None):
+        # the chain must be the one saved in filename, i.e. its last block is the file's last block
+        if filename is None:
+            filename = 'blockchain.dat'
+        aggregates = {'blocks': 0, 'documents': 0, 'nice': 0, 'naughty': 0}
+        if self.snapshot is not None:
+            aggregates.update(self.snapshot['aggregates'])
+        for b in self.blocks:
+            aggregates['blocks'] += 1
+            aggregates['documents'] += b.doc_count
+            aggregates['nice' if b.sign == Nice else 'naughty'] += 1
+        offset = os.path.getsize(filename)
+        if self.blocks:
+            last_offset = offset - len(self.blocks[-1].block_data_signed())
+        else:
+            last_offset = self.snapshot.get('last_offset') if self.snapshot else None
+        snap = {'index': self.index, 'initial_index': self.snapshot['initial_index'] if self.snapshot else self.initial_index, 'last_hash_value': self.last_hash_value, 'offset': offset, 'last_offset': last_offset, 'aggregates': aggregates}
+        with open(snapshot_filename(filename), 'a') as fh:
+            fh.write(json.dumps(snap) + '\n')
+        return snap
+
+    def save_segments(self, directory, blocks_per_segment=100000):
+        os.makedirs(directory, exist_ok=True)
+        manifest = {'blocks_per_segment': blocks_per_segment, 'segments': []}
+        for start in range(0, len(self.blocks), blocks_per_segment):
+            blocks = self.blocks[start:start + blocks_per_segment]
+            segment = {'file': segment_name(len(manifest['segments'])), 'first_index': blocks[0].index, 'previous_hash': blocks[0].previous_hash, 'blocks': len(blocks)}
+            with open(os.path.join(directory, segment['file']), 'wb') as fh:
+                for b in blocks:
+                    fh.write(b.block_data_signed())
+            manifest['segments'].append(segment)
+        save_manifest(directory, manifest)
+
+    def append_to_segments(self, index, directory):
+        # full segments are never written again; a new one is started when the last one is full
+        manifest = load_manifest(directory)
+        b = self.blocks[index]
+        segments = manifest['segments']
+        if not segments or segments[-1]['blocks'] >= manifest['blocks_per_segment']:
+            segments.append({'file': segment_name(len(segments)), 'first_index': b.index, 'previous_hash': b.previous_hash, 'blocks': 0})
+        with open(os.path.join(directory, segments[-1]['file']), 'ab') as fh:
+            fh.write(b.block_data_signed())
+        segments[-1]['blocks'] += 1
+        save_manifest(directory, manifest)
+
+    def load_segments(self, directory, segments=None, processes=None):
+        manifest = load_manifest(directory)
+        if segments is None:
+            segments = range(len(manifest['segments']))
+        files = [os.path.join(directory, manifest['segments'][n]['file']) for n in segments]
+        if processes == 1 or len(files) < 2:
+            loaded = map(_load_segment, files)
+        else:
+            import multiprocessing
+            with multiprocessing.Pool(processes) as pool:
+                loaded = pool.map(_load_segment, files)
+        count = 0
+        for blocks in loaded:
+            self.blocks += blocks
+            count += len(blocks)
+        if self.blocks:
+            self.index = self.blocks[-1].index
+        return count
+
+    def load_chain(self, filename=None, offset=0):
         count = 0
         if filename is None:
             filename = 'blockchain.dat'
+        if os.path.isdir(filename):
+            return self.load_segments(filename)
+        if is_sqlite(filename):
+            from sqlite_store import load_blocks
+            blocks = load_blocks(filename)
+            self.blocks += blocks
+            if blocks:
+                self.index = blocks[-1].index
+            return len(blocks)
         with open(filename, 'rb') as fh:
+            if fh.read(len(archive_magic)) == archive_magic:
+                from chain_archive import ArchiveReader
+                for b in ArchiveReader(filename):
+                    self.blocks.append(b)
+                    self.index = b.index
+                    count += 1
+                return count
+            fh.seek(offset)
             while(1):
                 try:
                     self.blocks.append(Block(load=True).load_a_block(fh))
@@ -413,10 +858,349 @@ class Chain():
                 except ValueError:
                     return count
 
+def iter_blocks(filename=None, offset=0):
+    # yields (file offset, block) for every block in a chain file, starting at the given byte
+    # offset (which must be the start of a block) and holding one block at a time
+    if filename is None:
+        filename = 'blockchain.dat'
+    with open(filename, 'rb') as fh:
+        fh.seek(offset)
+        while(1):
+            offset = fh.tell()
+            try:
+                block = Block(load=True).load_a_block(fh)
+            except ValueError:
+                return
+            yield offset, block
+
+
+def iter_headers(filename=None, offset=0, signatures=False):
+    # like iter_blocks(), but seeks over document data and signatures instead of reading them. Yields
+    # a dictionary of the header fields, named as in Block(), plus the block's 'offset' and 'length'
+    # in the file and a (type, length, file offset) tuple for each of its 'documents'. With
+    # signatures, the 'sig' is read as well, along with the two hashes exactly as stored ('hashes',
+    # 64 bytes) for callers that keep them in fixed-size slots.
+    if filename is None:
+        filename = 'blockchain.dat'
+    with open(filename, 'rb') as fh:
+        fh.seek(offset)
+        while(1):
+            start = fh.tell()
+            head = fh.read(74)
+            if len(head) < 74:
+                return
+            try:
+                h = {'offset': start, 'index': int(head[0:16], 16), 'nonce': int(head[16:32], 16), 'pid': int(head[32:48], 16), 'rid': int(head[48:64], 16), 'doc_count': int(head[64:65], 10), 'score': int(head[65:73], 16), 'sign': int(head[73:74], 10)}
+                h['documents'] = []
+                for n in range(h['doc_count']):
+                    d = fh.read(10)
+                    h['documents'].append((int(d[0:2], 16), int(d[2:10], 16), fh.tell()))
+                    fh.seek(h['documents'][-1][1], 1)
+                tail = fh.read(74)
+                sig = fh.read(344)
+                if len(tail) < 74 or len(sig) < 344:
+                    return
+                h['month'], h['day'], h['hour'], h['minute'], h['second'] = [int(tail[n:n + 2]) for n in range(0, 10, 2)]
+            except ValueError:
+                return
+            if tail[10:74].isalnum():
+                h['previous_hash'], h['hash'] = tail[10:42].decode('utf-8'), tail[42:74].decode('utf-8')
+            else:
+                h['previous_hash'], h['hash'] = str(tail[10:42])[2:-1], str(tail[42:74])[2:-1]  # as load_a_block()
+            if signatures:
+                h['sig'] = sig
+                h['hashes'] = tail[10:74]
+            h['length'] = fh.tell() - start
+            yield h
+
+
+def segment_name(n):
+    return 'segment-%06.06i.dat' % (n)
+
+
+def load_manifest(directory):
+    with open(os.path.join(directory, 'manifest.json'), 'r') as fh:
+        return json.load(fh)
+
+
+def save_manifest(directory, manifest):
+    with open(os.path.join(directory, 'manifest.json.tmp'), 'w') as fh:
+        json.dump(manifest, fh, indent=1)
+    os.replace(os.path.join(directory, 'manifest.json.tmp'), os.path.join(directory, 'manifest.json'))
+
+
+def _load_segment(filename):
+    return [b for o, b in iter_blocks(filename)]
+
+
+def _verify_segment(job):
+    # verify_chain() failures for one segment, plus the full hash of its last block
+    n, filename, segment, key = job
+    c = Chain.__new__(Chain)  # a chain holding just this segment, which may not even parse
+    c.blocks = _load_segment(filename)
+    c.initial_index = segment['first_index']
+    c.index = c.blocks[-1].index if c.blocks else None
+    c.last_hash_value = c.blocks[-1].full_hash() if c.blocks else None
+    _crypto()
+    failures = c.verify_chain(RSA.importKey(key), previous_hash=segment['previous_hash'], audit=True)
+    if len(c.blocks) != segment['blocks']:
+        failures.append({'check': 'segment', 'position': len(c.blocks), 'index': c.index, 'expected': segment['blocks']})
+    for f in failures:
+        f['segment'] = n
+    return failures, c.last_hash_value
+
+
+def verify_segments(directory, publickey, processes=None):
+    # verify_chain(audit=True) for a segmented chain, one segment per worker; the failures of all
+    # segments are returned together, each tagged with the number of its segment
+    manifest = load_manifest(directory)
+    key = publickey.export_key()
+    jobs = [(n, os.path.join(directory, seg['file']), seg, key) for n, seg in enumerate(manifest['segments'])]
+    import multiprocessing
+    with multiprocessing.Pool(processes) as pool:
+        results = pool.map(_verify_segment, jobs)
+    failures = []
+    for n, (segment_failures, last_hash) in enumerate(results):
+        failures += segment_failures
+        # each segment must start from the hash of the last block of the one before
+        if n + 1 < len(results) and manifest['segments'][n + 1]['previous_hash'] != last_hash:
+            failures.append({'check': 'link', 'position': 0, 'index': manifest['segments'][n + 1]['first_index'], 'expected': last_hash, 'found': manifest['segments'][n + 1]['previous_hash'], 'segment': n + 1})
+    return failures
+
+
+def _copy_segment(job):
+    # copies one segment into place and returns the checksum sidecar records for its blocks
+    source, filename, offset = job
+    with open(source, 'rb') as fh:
+        data = fh.read()
+    fd = os.open(filename, os.O_WRONLY)
+    try:
+        os.pwrite(fd, data, offset)
+    finally:
+        os.close(fd)
+    return b''.join(checksum_record.pack(offset + h['offset'], h['length'], zlib.crc32(data[h['offset']:h['offset'] + h['length']])) for h in iter_headers(source))
+
+
+def export_segments(directory, filename=None, processes=None):
+    # writes a segmented chain out as a single chain file; every segment is copied by its own worker
+    if filename is None:
+        filename = 'blockchain.dat'
+    manifest = load_manifest(directory)
+    sources = [os.path.join(directory, seg['file']) for seg in manifest['segments']]
+    jobs = []
+    offset = 0
+    for source in sources:
+        jobs.append((source, filename, offset))
+        offset += os.path.getsize(source)
+    with open(filename, 'wb') as fh:
+        fh.truncate(offset)
+    import multiprocessing
+    with multiprocessing.Pool(processes) as pool:
+        records = pool.map(_copy_segment, jobs)
+    with open(checksum_filename(filename), 'wb') as ch:
+        ch.write(b''.join(records))
+
+
+def is_sqlite(filename):
+    # an SQLite database holding a chain (see sqlite_store.py), or the name of a new one
+    if not os.path.exists(filename):
+        return filename.endswith(('.db', '.sqlite', '.sqlite3'))
+    with open(filename, 'rb') as fh:
+        return fh.read(16) == b'SQLite format 3\x00'
+
+
+def snapshot_filename(filename):
+    return filename + '.snap'
+
+
+def _snapshot_matches(filename, snap):
+    # whether the block the snapshot ends with is still in the file, where the snapshot says it is
+    if 'last_offset' not in snap:
+        return True  # written before snapshots recorded the last block's offset
+    if snap['last_offset'] is None:
+        return snap['offset'] == 0
+    with open(filename, 'rb') as fh:
+        fh.seek(snap['last_offset'])
+        try:
+            block = Block(load=True).load_a_block(fh)
+        except ValueError:
+            return False
+        return fh.tell() == snap['offset'] and block.index == snap['index'] and block.full_hash() == snap['last_hash_value']
+
+
+def latest_snapshot(filename=None):
+    # the newest snapshot of a chain file that the file still covers and that ends with a block
+    # the file holds at the recorded offset, or None
+    if filename is None:
+        filename = 'blockchain.dat'
+    if not os.path.exists(snapshot_filename(filename)):
+        return None
+    size = os.path.getsize(filename)
+    snapshots = []
+    with open(snapshot_filename(filename), 'r') as fh:
+        for line in fh:
+            try:
+                snap = json.loads(line)
+            except ValueError:
+                continue  # a snapshot cut short while being written
+            if snap['offset'] <= size:
+                snapshots.append(snap)
+    for snap in reversed(snapshots):
+        if _snapshot_matches(filename, snap):
+            return snap
+    return None
+
+
+def checksum_filename(filename):
+    return filename + '.crc'
+
+
+def quick_check(filename=None):
+    # Cheap first pass over a chain file using the CRC32 sidecar written by save_chain() and
+    # append_a_block(). Returns a list of suspect blocks (position in the file, byte offset,
+    # length and the problem found); only these need the full MD5/RSA verify_chain() treatment.
+    if filename is None:
+        filename = 'blockchain.dat'
+    suspects = []
+    records = b''  # without a sidecar the whole file is reported as unchecked
+    if os.path.exists(checksum_filename(filename)):
+        with open(checksum_filename(filename), 'rb') as ch:
+            records = ch.read()
+    usable = len(records) - len(records) % checksum_record.size
+    if usable != len(records):
+        suspects.append({'position': usable // checksum_record.size, 'offset': None, 'length': None, 'problem': 'truncated checksums'})
+    with open(filename, 'rb') as fh:
+        end = 0
+        for position, (offset, length, crc) in enumerate(checksum_record.iter_unpack(records[:usable])):
+            fh.seek(offset)
+            data = fh.read(length)
+            if len(data) != length:
+                suspects.append({'position': position, 'offset': offset, 'length': length, 'problem': 'truncated'})
+            elif zlib.crc32(data) != crc:
+                suspects.append({'position': position, 'offset': offset, 'length': length, 'problem': 'checksum'})
+            end = offset + length
+        fh.seek(0, 2)
+        if fh.tell() > end:
+            suspects.append({'position': usable // checksum_record.size, 'offset': end, 'length': fh.tell() - end, 'problem': 'unchecked data'})
+    return suspects
+
+
+def block_offsets(filename=None):
+    # (offset, length) of every block in a chain file. The checksum sidecar supplies them as far as
+    # it runs contiguously and within the file, provided its last record is a block the file really
+    # holds there (a sidecar left over from another chain is ignored); any blocks past that are
+    # found with a header scan.
+    if filename is None:
+        filename = 'blockchain.dat'
+    blocks, end = [], 0
+    size = os.path.getsize(filename)
+    if os.path.exists(checksum_filename(filename)):
+        with open(checksum_filename(filename), 'rb') as ch:
+            records = ch.read()
+        for offset, length, crc in checksum_record.iter_unpack(records[:len(records) - len(records) % checksum_record.size]):
+            if offset != end or offset + length > size:
+                break
+            blocks.append((offset, length))
+            end = offset + length
+    if blocks:
+        h = next(iter_headers(filename, blocks[-1][0]), None)
+        if h is None or h['length'] != blocks[-1][1]:
+            blocks, end = [], 0
+    for h in iter_headers(filename, end):
+        blocks.append((h['offset'], h['length']))
+    return blocks
+
+
+def _find_block(filename, index):
+    # header-only scan for the block with the given index; indexes only increase along a chain
+    for h in iter_headers(filename):
+        if h['index'] == index:
+            with open(filename, 'rb') as fh:
+                fh.seek(h['offset'])
+                return Block(load=True).load_a_block(fh)
+        if h['index'] > index:
+            break
+    print('*** WARNING *** No block with index %i in %s.' % (index, filename))
+    return None
+
+
+def main(argv):
+    usage = 'usage: python3 -m naughty_nice [verify <chain> <public key> [beginning hash] | ls <chain> | get <chain> <index> | dump <chain> <index> [document] | stats <chain>]'
+    if not argv:
+        # no command: verify the Official Naughty/Nice Blockchain and list its nonces, as always
+        _crypto()
+        with open('official_public.pem', 'rb') as fh:
+            official_public_key = RSA.importKey(fh.read())
+            c2 = Chain(load=True, filename='blockchain.dat')
+            print('C2: Block chain verify: %s' % (c2.verify_chain(official_public_key, previous_hash='c6e2e6ecb785e7132c8003ab5aaba88d')))
+            for block in c2.blocks:
+                print(block.nonce)
+        return 0
+    command, args = argv[0], argv[1:]
+    if command in ('get', 'dump') and not all(a.isdigit() for a in args[1:]):
+        print(usage)  # block indexes and document numbers are decimal numbers
+        return 1
+    if args and not os.path.exists(args[0]):
+        print('*** WARNING *** No chain file %s.' % (args[0]))
+        return 1
+    if command == 'verify' and len(args) in (2, 3):
+        if not os.path.exists(args[1]):
+            print('*** WARNING *** No public key file %s.' % (args[1]))
+            return 1
+        _crypto()
+        with open(args[1], 'rb') as fh:
+            try:
+                key = RSA.importKey(fh.read())
+            except ValueError:
+                print('*** WARNING *** %s is not an RSA key.' % (args[1]))
+                return 1
+        c = Chain(load=True, filename=args[0])
+        failures = c.verify_chain(key, args[2] if len(args) > 2 else None, audit=True)
+        for f in failures:
+            print('*** WARNING *** Block %s at position %i failed the %s check.' % (f['index'], f['position'], f['check']))
+        print('Block chain verify: %s (%i blocks)' % (not failures, len(c.blocks)))
+        return 1 if failures else 0
+    elif command == 'ls' and len(args) == 1:
+        for h in iter_headers(args[0]):
+            print('Block %i at offset %i: pid %016.016x, %s %i, %i document(s), %02i/%02i %02i:%02i:%02i' % (h['index'], h['offset'], h['pid'], 'Nice' if h['sign'] == Nice else 'Naughty', h['score'], h['doc_count'], h['month'], h['day'], h['hour'], h['minute'], h['second']))
+        return 0
+    elif command == 'get' and len(args) == 2:
+        block = _find_block(args[0], int(args[1]))
+        if block is None:
+            return 1
+        print(block)
+        return 0
+    elif command == 'dump' and len(args) in (2, 3):
+        block = _find_block(args[0], int(args[1]))
+        if block is None:
+            return 1
+        if len(args) > 2 and not 1 <= int(args[2]) <= block.doc_count:
+            print('*** WARNING *** Block %i has no document %s (it has %i).' % (block.index, args[2], block.doc_count))
+            return 1
+        for n in ([int(args[2])] if len(args) > 2 else range(1, block.doc_count + 1)):
+            block.dump_doc(n)
+        return 0
+    elif command == 'stats' and len(args) == 1:
+        blocks, documents, document_bytes, pids = 0, 0, 0, set()
+        records, scores = {Nice: 0, Naughty: 0}, {Nice: 0, Naughty: 0}
+        first = last = None
+        for h in iter_headers(args[0]):
+            blocks += 1
+            documents += h['doc_count']
+            document_bytes += sum(d[1] for d in h['documents'])
+            pids.add(h['pid'])
+            records[h['sign']] = records.get(h['sign'], 0) + 1
+            scores[h['sign']] = scores.get(h['sign'], 0) + h['score']
+            if first is None:
+                first = h['index']
+            last = h['index']
+        print('%s: %i bytes, %i blocks (index %s to %s)' % (args[0], os.path.getsize(args[0]), blocks, first, last))
+        print('%i documents (%i bytes), %i distinct pids' % (documents, document_bytes, len(pids)))
+        print('%i Nice records (score %i), %i Naughty records (score %i)' % (records[Nice], scores[Nice], records[Naughty], scores[Naughty]))
+        return 0
+    print(usage)
+    return 1
+
+
 if __name__ == '__main__':
-    with open('official_public.pem', 'rb') as fh:
-        official_public_key = RSA.importKey(fh.read())
-        c2 = Chain(load=True, filename='blockchain.dat')
-        print('C2: Block chain verify: %s' % (c2.verify_chain(official_public_key, previous_hash='c6e2e6ecb785e7132c8003ab5aaba88d')))
-        for block in c2.blocks:
-            print block.nonce
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+'''
+Finds the blocks recorded for a Personal ID (pid) across many Naughty/Nice chains.
+
+A PidIndex is an inverted index from pid to (chain file, block index, file offset). It is built
+from header-only scans (iter_headers()), so documents are never read, and is kept in three files:
+
+    <filename>        - fixed-size records sorted by (pid, chain, block index); a lookup is a binary
+                        search over the records, i.e. a few seeks
+    <filename>.log    - records for blocks indexed since the last compaction, in arrival order;
+                        it is read into memory (by pid) once, and after that only the records
+                        appended to it since are read
+    <filename>.chains - the chain files covered, and how far into each one has been indexed
+
+    PidIndex(<filename>) - opens (or creates) the index, "pid.idx" by default.
+
+    add_chain(chain_filename) - adds a chain file to the set of indexed chains.
+
+    update() - scans every chain from where the previous update stopped, so only appended blocks
+    are read, and logs their records. The log is merged into the sorted file once it grows past
+    compact_after records.
+
+    add(chain_filename, block, offset) - logs a single block written at offset, e.g. straight after
+    Chain.append_a_block(). If it is the next block update() would have read, the chain's scan
+    position moves past it.
+
+    compact() - merges the log into the sorted file.
+
+    lookup(pid) - returns a sorted list of (chain filename, block index, offset).
+'''
+
+import json
+import os
+import struct
+import sys
+
+from naughty_nice import iter_headers
+
+record = struct.Struct('>QIQQ')  # pid, chain id, block index, offset
+
+
+class PidIndex():
+    compact_after = 100000
+
+    def __init__(self, filename=None):
+        if filename is None:
+            filename = 'pid.idx'
+        self.filename = filename
+        self.chains = []  # [chain filename, offset of the next block to index]
+        if os.path.exists(filename + '.chains'):
+            with open(filename + '.chains', 'r') as fh:
+                self.chains = json.load(fh)
+        for f in (filename, filename + '.log'):
+            if not os.path.exists(f):
+                open(f, 'wb').close()
+        self._log = {}  # pid -> records from the log, as far as it has been read
+        self._log_read = (0, 0)  # size of the sorted file and bytes of the log read into _log
+
+    def _save_chains(self):
+        with open(self.filename + '.chains.tmp', 'w') as fh:
+            json.dump(self.chains, fh)
+        os.replace(self.filename + '.chains.tmp', self.filename + '.chains')
+
+    def _chain_id(self, chain_filename):
+        for n, c in enumerate(self.chains):
+            if c[0] == chain_filename:
+                return n
+        return None
+
+    def add_chain(self, chain_filename):
+        n = self._chain_id(chain_filename)
+        if n is None:
+            self.chains.append([chain_filename, 0])
+            self._save_chains()
+            n = len(self.chains) - 1
+        return n
+
+    def add(self, chain_filename, block, offset):
+        n = self.add_chain(chain_filename)
+        with open(self.filename + '.log', 'ab') as fh:
+            fh.write(record.pack(block.pid, n, block.index, offset))
+        if self.chains[n][1] == offset:
+            self.chains[n][1] = offset + len(block.block_data_signed())
+            self._save_chains()
+
+    def update(self):
+        count = 0
+        with open(self.filename + '.log', 'ab') as fh:
+            for n, c in enumerate(self.chains):
+                for h in iter_headers(c[0], c[1]):
+                    fh.write(record.pack(h['pid'], n, h['index'], h['offset']))
+                    c[1] = h['offset'] + h['length']
+                    count += 1
+        self._save_chains()
+        if os.path.getsize(self.filename + '.log') // record.size > self.compact_after:
+            self.compact()
+        return count
+
+    def compact(self):
+        with open(self.filename, 'rb') as fh:
+            records = list(record.iter_unpack(fh.read()))
+        with open(self.filename + '.log', 'rb') as fh:
+            records += list(record.iter_unpack(fh.read()))
+        records = sorted(set(records))
+        with open(self.filename + '.tmp', 'wb') as fh:
+            for r in records:
+                fh.write(record.pack(*r))
+        os.replace(self.filename + '.tmp', self.filename)
+        open(self.filename + '.log', 'wb').close()
+        self._log, self._log_read = {}, (0, 0)
+
+    def _read_log(self):
+        # brings _log up to date with the log file, reading only what was appended since last time.
+        # A log that shrank, or a sorted file that changed size, means it was compacted (perhaps by
+        # another process), so the log is read again from the start.
+        sorted_size, log_size = os.path.getsize(self.filename), os.path.getsize(self.filename + '.log')
+        if sorted_size != self._log_read[0] or log_size < self._log_read[1]:
+            self._log, self._log_read = {}, (sorted_size, 0)
+        if log_size - log_size % record.size > self._log_read[1]:
+            with open(self.filename + '.log', 'rb') as fh:
+                fh.seek(self._log_read[1])
+                data = fh.read(log_size - log_size % record.size - self._log_read[1])
+            for r in record.iter_unpack(data):
+                self._log.setdefault(r[0], []).append(r)
+            self._log_read = (sorted_size, self._log_read[1] + len(data))
+
+    def _sorted_records(self, pid):
+        with open(self.filename, 'rb') as fh:
+            low, high = 0, os.path.getsize(self.filename) // record.size
+            while low < high:  # first record with a pid >= the one wanted
+                mid = (low + high) // 2
+                fh.seek(mid * record.size)
+                if record.unpack(fh.read(record.size))[0] < pid:
+                    low = mid + 1
+                else:
+                    high = mid
+            fh.seek(low * record.size)
+            while(1):
+                r = fh.read(record.size)
+                if len(r) < record.size:
+                    return
+                r = record.unpack(r)
+                if r[0] != pid:
+                    return
+                yield r
+
+    def lookup(self, pid):
+        found = set(self._sorted_records(pid))
+        self._read_log()
+        found.update(self._log.get(pid, ()))
+        return [(self.chains[c][0], index, offset) for p, c, index, offset in sorted(found)]
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('usage: %s <chain file>... [-- pid...]' % (sys.argv[0]))
+        sys.exit(1)
+    args = sys.argv[1:]
+    pids = []
+    if '--' in args:
+        pids = [int(p, 16) for p in args[args.index('--') + 1:]]
+        args = args[:args.index('--')]
+    index = PidIndex()
+    for chain_filename in args:
+        index.add_chain(chain_filename)
+    print('%i block(s) indexed' % (index.update()))
+    for pid in pids:
+        for chain_filename, block_index, offset in index.lookup(pid):
+            print('%016.016x: %s block %i at offset %i' % (pid, chain_filename, block_index, offset))
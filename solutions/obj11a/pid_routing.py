@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+'''
+The pid routing database and a query dispatcher built on it.
+
+Each Personal ID (pid) is assigned to exactly one of the Naughty/Nice blockchains. PidRouter keeps
+that assignment in a local SQLite database (by default "routing.db") and uses it to send queries
+for a batch of pids to the chain files that hold them, and no others.
+
+    PidRouter(<filename>) - opens (or creates) the routing database.
+
+    assign(pid, chain_filename) - assigns a pid to a chain file, replacing any earlier assignment.
+
+    assign_chain(chain_filename) - assigns every pid found in a chain file to it (a header-only scan).
+
+    route(pids) - returns {chain filename: [pids]} for the pids that have an assignment.
+
+    query(pids, <processes>) - returns {pid: [block, ...]} for every pid asked for. Each chain file
+    involved is read by its own worker process, in parallel, and only once per batch; pids without
+    an assignment get an empty list.
+'''
+
+import multiprocessing
+import sqlite3
+import sys
+
+from naughty_nice import iter_blocks, iter_headers
+
+
+def _query_chain(job):
+    # the blocks for the given pids in one chain file, as [(pid, block)]
+    chain_filename, pids = job
+    pids = set(pids)
+    found = []
+    for h in iter_headers(chain_filename):
+        if h['pid'] in pids:
+            for offset, block in iter_blocks(chain_filename, h['offset']):
+                found.append((block.pid, block))
+                break
+    return found
+
+
+class PidRouter():
+    def __init__(self, filename=None):
+        if filename is None:
+            filename = 'routing.db'
+        self.db = sqlite3.connect(filename)
+        # pids are unsigned 64-bit, too large for an SQLite INTEGER, so they are stored as in the blocks
+        self.db.execute('CREATE TABLE IF NOT EXISTS routes (pid TEXT PRIMARY KEY, chain TEXT NOT NULL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS routes_chain ON routes (chain)')
+
+    def assign(self, pid, chain_filename):
+        self.db.execute('INSERT OR REPLACE INTO routes VALUES (?, ?)', ('%016.016x' % (pid), chain_filename))
+        self.db.commit()
+
+    def assign_chain(self, chain_filename):
+        pids = set(h['pid'] for h in iter_headers(chain_filename))
+        self.db.executemany('INSERT OR REPLACE INTO routes VALUES (?, ?)', [('%016.016x' % (pid), chain_filename) for pid in pids])
+        self.db.commit()
+        return len(pids)
+
+    def route(self, pids):
+        routes = {}
+        for pid in set(pids):
+            row = self.db.execute('SELECT chain FROM routes WHERE pid = ?', ('%016.016x' % (pid),)).fetchone()
+            if row is not None:
+                routes.setdefault(row[0], []).append(pid)
+        return routes
+
+    def query(self, pids, processes=None):
+        results = {pid: [] for pid in pids}
+        jobs = list(self.route(pids).items())
+        if len(jobs) == 1 or processes == 1:
+            found = map(_query_chain, jobs)
+        else:
+            with multiprocessing.Pool(processes) as pool:
+                found = pool.map(_query_chain, jobs)
+        for chain_found in found:
+            for pid, block in chain_found:
+                results[pid].append(block)
+        return results
+
+    def close(self):
+        self.db.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('usage: %s assign <chain file>... | %s query <pid>...' % (sys.argv[0], sys.argv[0]))
+        sys.exit(1)
+    router = PidRouter()
+    if sys.argv[1] == 'assign':
+        for chain_filename in sys.argv[2:]:
+            print('%s: %i pid(s) assigned' % (chain_filename, router.assign_chain(chain_filename)))
+    else:
+        for pid, blocks in router.query([int(p, 16) for p in sys.argv[2:]]).items():
+            print('%016.016x: %i block(s)' % (pid, len(blocks)))
+            for block in blocks:
+                print(block)
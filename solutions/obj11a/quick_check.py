@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+
+from naughty_nice import checksum_filename, quick_check
+
+if __name__ == '__main__':
+    filename = sys.argv[1] if len(sys.argv) > 1 else 'blockchain.dat'
+    if not os.path.exists(filename):
+        print('*** WARNING *** No chain file %s.' % (filename))
+        sys.exit(1)
+    if not os.path.exists(checksum_filename(filename)):
+        print('*** WARNING *** %s has no checksum sidecar (%s), so none of it can be checked.' % (filename, checksum_filename(filename)))
+    suspects = quick_check(filename)
+    for s in suspects:
+        print('Suspect block at position %s (offset %s, length %s): %s' % (s['position'], s['offset'], s['length'], s['problem']))
+    print('%s: %i suspect block(s)' % (filename, len(suspects)))
+    sys.exit(1 if suspects else 0)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+'''
+A running Naughty/Nice score ledger for a chain.
+
+A ScoreLedger keeps, for every pid, the total score of its Nice records, the total score of its
+Naughty records, the number of records and the index of its latest block, together with a
+checkpoint of the last block applied. It is stored in <chain file>.ledger, so rankings can be read
+from it without going through the chain again.
+
+    ScoreLedger(chain_filename, <filename>) - opens the ledger, or starts an empty one.
+
+    apply(block, <next_offset>) - adds one block (a Block() or an iter_headers() dictionary). Blocks
+    at or before the checkpoint are ignored, so a block is never counted twice. For a Block(),
+    next_offset is the file offset just past it, which lets the next update() start there. Setting
+    a Chain()'s ledger attribute to a ScoreLedger applies every block written by its
+    append_a_block(), with its offset. Neither saves the ledger: call save() (or update(), which
+    saves) when convenient; a ledger that was not saved simply catches up from its saved
+    checkpoint the next time update() is called.
+
+    update() - applies the blocks appended to the chain file since the checkpoint (a header-only
+    scan) and saves the ledger.
+
+    ranking(<count>, <naughty>) - the nicest (or naughtiest) pids by Nice total minus Naughty
+    total, as (pid, nice, naughty, records, last block) tuples.
+
+    rebuild(<processes>) / verify(<processes>) - recompute the ledger from the chain file. The file
+    is split at block boundaries taken from its checksum sidecar (by block_offsets(), so a stale
+    sidecar is not trusted) and the parts are tallied in parallel (without a sidecar the whole file
+    is tallied by one process). rebuild() replaces and saves the ledger; verify() returns the pids
+    whose entries disagree with the chain, leaving the ledger as it is.
+'''
+
+import multiprocessing
+import os
+import struct
+import sys
+
+from naughty_nice import Nice, block_offsets, checksum_filename, iter_headers
+
+checkpoint = struct.Struct('>qq')  # index of the last block applied (-1 for none), offset of the next block (-1 if unknown)
+entry = struct.Struct('>QQQQQ')  # pid, nice total, naughty total, records, last block
+
+
+def _fields(block):
+    if isinstance(block, dict):
+        return block['index'], block['pid'], block['score'], block['sign']
+    return block.index, block.pid, block.score, block.sign
+
+
+def _add(entries, index, pid, score, sign):
+    e = entries.setdefault(pid, [0, 0, 0, 0])
+    if sign == Nice:
+        e[0] += score
+    else:
+        e[1] += score
+    e[2] += 1
+    e[3] = max(e[3], index)
+
+
+def _tally(job):
+    # entries for the blocks starting at offsets start..end-1, plus the last index and end offset seen
+    filename, start, end = job
+    entries, last, next_offset = {}, -1, start
+    for h in iter_headers(filename, start):
+        if end is not None and h['offset'] >= end:
+            break
+        _add(entries, h['index'], h['pid'], h['score'], h['sign'])
+        last, next_offset = max(last, h['index']), h['offset'] + h['length']
+    return entries, last, next_offset
+
+
+class ScoreLedger():
+    def __init__(self, chain_filename, filename=None):
+        if filename is None:
+            filename = chain_filename + '.ledger'
+        self.chain_filename = chain_filename
+        self.filename = filename
+        self.entries = {}
+        self.last_index, self.next_offset = -1, 0
+        if os.path.exists(filename):
+            with open(filename, 'rb') as fh:
+                data = fh.read()
+            self.last_index, self.next_offset = checkpoint.unpack(data[:checkpoint.size])
+            for pid, nice, naughty, records, last in entry.iter_unpack(data[checkpoint.size:]):
+                self.entries[pid] = [nice, naughty, records, last]
+
+    def save(self):
+        with open(self.filename + '.tmp', 'wb') as fh:
+            fh.write(checkpoint.pack(self.last_index, self.next_offset))
+            for pid, e in self.entries.items():
+                fh.write(entry.pack(pid, *e))
+        os.replace(self.filename + '.tmp', self.filename)
+
+    def apply(self, block, next_offset=None):
+        index, pid, score, sign = _fields(block)
+        if index <= self.last_index:
+            return False
+        _add(self.entries, index, pid, score, sign)
+        self.last_index = index
+        if isinstance(block, dict):
+            next_offset = block['offset'] + block['length']
+        self.next_offset = -1 if next_offset is None else next_offset
+        return True
+
+    def update(self):
+        count = 0
+        for h in iter_headers(self.chain_filename, max(self.next_offset, 0)):
+            if self.apply(h):
+                count += 1
+            elif h['index'] == self.last_index:
+                # applied without its offset (a Block() on its own), so the scan started further back
+                self.next_offset = h['offset'] + h['length']
+        self.save()
+        return count
+
+    def ranking(self, count=10, naughty=False):
+        ranked = sorted(self.entries.items(), key=lambda e: e[1][0] - e[1][1], reverse=not naughty)
+        return [(pid,) + tuple(e) for pid, e in ranked[:count]]
+
+    def _recompute(self, processes=None):
+        jobs = [(self.chain_filename, 0, None)]
+        if os.path.exists(checksum_filename(self.chain_filename)):
+            offsets = [o for o, l in block_offsets(self.chain_filename)]  # checked against the file
+            if processes is None:
+                processes = multiprocessing.cpu_count()
+            step = max(1, len(offsets) // processes)
+            starts = offsets[::step]
+            jobs = [(self.chain_filename, s, e) for s, e in zip(starts, starts[1:] + [None])]
+        if len(jobs) == 1:
+            results = map(_tally, jobs)
+        else:
+            with multiprocessing.Pool(len(jobs)) as pool:
+                results = pool.map(_tally, jobs)
+        entries, last_index, next_offset = {}, -1, 0
+        for part, last, end in results:
+            for pid, (nice, naughty, records, last_block) in part.items():
+                e = entries.setdefault(pid, [0, 0, 0, 0])
+                e[0], e[1], e[2], e[3] = e[0] + nice, e[1] + naughty, e[2] + records, max(e[3], last_block)
+            if last > last_index:
+                last_index, next_offset = last, end
+        return entries, last_index, next_offset
+
+    def rebuild(self, processes=None):
+        self.entries, self.last_index, self.next_offset = self._recompute(processes)
+        self.save()
+
+    def verify(self, processes=None):
+        entries, last_index, next_offset = self._recompute(processes)
+        return sorted(pid for pid in set(entries) | set(self.entries) if entries.get(pid) != self.entries.get(pid))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('usage: %s <chain file> [rebuild|verify]' % (sys.argv[0]))
+        sys.exit(1)
+    ledger = ScoreLedger(sys.argv[1])
+    if len(sys.argv) > 2 and sys.argv[2] == 'rebuild':
+        ledger.rebuild()
+    elif len(sys.argv) > 2 and sys.argv[2] == 'verify':
+        bad = ledger.verify()
+        for pid in bad:
+            print('Ledger entry for %016.016x does not match the chain' % (pid))
+        sys.exit(1 if bad else 0)
+    else:
+        print('%i block(s) applied' % (ledger.update()))
+    for title, naughty in (('Nicest', False), ('Naughtiest', True)):
+        print('%s:' % (title))
+        for pid, nice, naughty_total, records, last in ledger.ranking(naughty=naughty):
+            print('    %016.016x: %i nice, %i naughty in %i record(s), last at block %i' % (pid, nice, naughty_total, records, last))
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+
+'''
+A Naughty/Nice chain held in shared memory, for multiprocessing pools.
+
+SharedChain loads a chain file once into a multiprocessing.shared_memory block: the block offsets
+and the header fields as columns (the same columns as chain_table.py, as native arrays), followed
+by the chain file's bytes. Pickling a SharedChain only sends the name of the shared memory, and a
+worker that receives one attaches to it (once per process) instead of reading or parsing the file,
+so passing the chain to a pool costs the same whatever its size and the chain is in memory only
+once. Its blocks are the read-only proxies of mapped_chain.py, reading from the shared memory.
+
+The process that created the SharedChain owns the shared memory: it must call unlink() when the
+workers are done with it (close() on its own only detaches).
+
+    SharedChain(<filename>) - loads a chain file (default blockchain.dat) into new shared memory.
+
+    SharedChain(name=<name>) - attaches to the shared memory of an existing SharedChain.
+
+    len(chain), chain[i], iteration, column(name) - the number of blocks, the block at position i,
+    every block in order, and a header field column as a memoryview (index, nonce, pid, rid,
+    doc_count, score, sign, month, day, hour, minute or second).
+
+    as_chain(<start>, <end>) - a Chain() holding the blocks at positions start..end-1.
+
+    verify(public_key, <beginning hash>, <processes>) - verify_chain(audit=True) with the chain split
+    into one range of positions per worker. Returns the failures of all ranges together.
+'''
+
+from array import array
+import multiprocessing
+from multiprocessing import shared_memory
+import struct
+import sys
+
+from Crypto.PublicKey import RSA
+
+from chain_table import columns
+from mapped_chain import BlockProxy
+from naughty_nice import Chain, iter_headers
+
+header_columns = [name for name in columns if name not in ('offset', 'length')]
+head = struct.Struct('=QQ')  # blocks, length of the chain data
+
+_attached = {}  # the SharedChains this process has attached to, by name
+
+
+def _aligned(n):
+    return (n + 7) & ~7
+
+
+class _Payload():
+    # slices of the chain data in shared memory, as bytes (which is what BlockProxy parses)
+    def __init__(self, buf, start):
+        self.buf = buf
+        self.start = start
+
+    def __getitem__(self, s):
+        return bytes(self.buf[self.start + s.start:self.start + s.stop])
+
+
+def _attach(name):
+    if name not in _attached:
+        _attached[name] = SharedChain(name=name)
+    return _attached[name]
+
+
+class SharedChain():
+    def __init__(self, filename=None, name=None):
+        if name is not None:
+            self.shm = shared_memory.SharedMemory(name=name)
+            blocks, length = head.unpack(self.shm.buf[:head.size])
+        else:
+            if filename is None:
+                filename = 'blockchain.dat'
+            offsets, values = array('Q'), {n: array(columns[n]) for n in header_columns}
+            length = 0
+            for h in iter_headers(filename):
+                offsets.append(h['offset'])
+                for n in header_columns:
+                    values[n].append(h[n])
+                length = h['offset'] + h['length']
+            offsets.append(length)
+            blocks = len(offsets) - 1
+        self._layout(blocks, length)
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=max(1, self._payload_start + length))
+            self.shm.buf[:head.size] = head.pack(blocks, length)
+            self._copy(self._offsets_start, offsets)
+            for n in header_columns:
+                self._copy(self._column_starts[n], values[n])
+            with open(filename, 'rb') as fh:
+                fh.readinto(self.shm.buf[self._payload_start:self._payload_start + length])
+        self.name = self.shm.name
+        self.blocks = blocks
+        self._views = []
+        self.offsets = self._view(self._offsets_start, 'Q', blocks + 1)
+        self._payload = _Payload(self.shm.buf, self._payload_start)
+
+    def _layout(self, blocks, length):
+        position = _aligned(head.size)
+        self._offsets_start = position
+        position += _aligned((blocks + 1) * 8)
+        self._column_starts = {}
+        for n in header_columns:
+            self._column_starts[n] = position
+            position += _aligned(blocks * array(columns[n]).itemsize)
+        self._payload_start = position
+
+    def _copy(self, start, values):
+        data = values.tobytes()
+        self.shm.buf[start:start + len(data)] = data
+
+    def _view(self, start, code, count):
+        view = self.shm.buf[start:start + count * array(code).itemsize].cast(code)
+        self._views.append(view)
+        return view
+
+    def __reduce__(self):
+        return (_attach, (self.name,))
+
+    def __len__(self):
+        return self.blocks
+
+    def __iter__(self):
+        for position in range(self.blocks):
+            yield self[position]
+
+    def __getitem__(self, position):
+        if position < 0:
+            position += self.blocks
+        if not 0 <= position < self.blocks:
+            raise IndexError('block position out of range')
+        return BlockProxy(self._payload, self.offsets[position], self.offsets[position + 1])
+
+    def column(self, name):
+        return self._view(self._column_starts[name], columns[name], self.blocks)
+
+    def as_chain(self, start=0, end=None):
+        if end is None:
+            end = self.blocks
+        c = Chain.__new__(Chain)  # no genesis block and no loading: the shared memory is the chain
+        c.blocks = [self[position] for position in range(start, end)]
+        if c.blocks:
+            c.index = c.blocks[-1].index
+            c.initial_index = c.blocks[0].index
+            c.last_hash_value = c.blocks[-1].full_hash()
+        return c
+
+    def verify(self, publickey, previous_hash=None, processes=None):
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        step = max(1, -(-self.blocks // processes))
+        key = publickey.export_key()
+        jobs = [(self, start, min(start + step, self.blocks), previous_hash, key) for start in range(0, self.blocks, step)]
+        with multiprocessing.Pool(min(processes, max(1, len(jobs)))) as pool:
+            results = pool.map(_verify_range, jobs)
+        return [f for failures in results for f in failures]
+
+    def close(self):
+        for view in self._views:
+            view.release()
+        self._views = []
+        self._payload = None
+        self.shm.close()
+        _attached.pop(self.name, None)
+
+    def unlink(self):
+        self.close()
+        self.shm.unlink()
+
+
+def _verify_range(job):
+    # verify_chain() failures for the blocks at positions start..end-1, with chain positions
+    shared, start, end, previous_hash, key = job
+    c = shared.as_chain(start, end)
+    if start > 0:
+        # checked against the block before the range, as in a single pass over the chain
+        previous_hash = shared[start - 1].full_hash()
+        c.initial_index = shared[start - 1].index + 1
+    failures = c.verify_chain(RSA.importKey(key), previous_hash, audit=True)
+    for f in failures:
+        f['position'] += start
+    return failures
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print('usage: %s <chain file> <public key> [beginning hash]' % (sys.argv[0]))
+        sys.exit(1)
+    chain = SharedChain(sys.argv[1])
+    try:
+        with open(sys.argv[2], 'rb') as fh:
+            key = RSA.importKey(fh.read())
+        failures = chain.verify(key, sys.argv[3] if len(sys.argv) > 3 else None)
+        for f in failures:
+            print('Block %s at position %i failed the %s check' % (f['index'], f['position'], f['check']))
+        print('%i blocks, %i failure(s)' % (len(chain), len(failures)))
+    finally:
+        chain.unlink()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+'''
+Keeps a Naughty/Nice chain in a local SQLite database instead of a chain file.
+
+Every header field has its own column (the 64-bit nonce, pid and rid as the same 16 hex digits used
+in the chain file, since SQLite integers are signed) and the index, pid, rid, score, sign and
+timestamp columns are indexed, so ad-hoc questions can be answered with SQL. Documents are kept as
+BLOBs in their own table. Nothing is normalized away: a block read back produces exactly the same
+block_data_signed() bytes, so signatures still verify.
+
+Chain.load_chain(), save_chain() and append_a_block() use this module for any file that is an SQLite
+database, or (for a file that does not exist yet) whose name ends in .db, .sqlite or .sqlite3.
+
+    save_blocks(filename, blocks) - replaces the contents of the database with the given blocks.
+
+    append_block(filename, block) - adds a block after the last one and returns its position.
+
+    load_blocks(filename, <where>, <parameters>) - returns the blocks in chain order, optionally only
+    those matching an SQL condition on the blocks table, e.g. load_blocks('chain.db', 'pid = ?',
+    ['%016.016x' % (pid)]) or load_blocks('chain.db', 'timestamp BETWEEN ? AND ?', [1201000000,
+    1224235959]) (timestamps are MMDDhhmmss).
+'''
+
+import sqlite3
+import sys
+
+from naughty_nice import Block, Document
+
+schema = [
+    'CREATE TABLE IF NOT EXISTS blocks (position INTEGER PRIMARY KEY, block_index INTEGER, nonce TEXT, pid TEXT, rid TEXT, doc_count INTEGER, score INTEGER, sign INTEGER, timestamp INTEGER, previous_hash TEXT, hash TEXT, sig BLOB)',
+    'CREATE TABLE IF NOT EXISTS documents (position INTEGER, number INTEGER, type INTEGER, length INTEGER, data BLOB, PRIMARY KEY (position, number))',
+    'CREATE INDEX IF NOT EXISTS blocks_index ON blocks (block_index)',
+    'CREATE INDEX IF NOT EXISTS blocks_pid ON blocks (pid)',
+    'CREATE INDEX IF NOT EXISTS blocks_rid ON blocks (rid)',
+    'CREATE INDEX IF NOT EXISTS blocks_score ON blocks (score)',
+    'CREATE INDEX IF NOT EXISTS blocks_sign ON blocks (sign)',
+    'CREATE INDEX IF NOT EXISTS blocks_timestamp ON blocks (timestamp)',
+]
+
+
+def connect(filename):
+    db = sqlite3.connect(filename)
+    for statement in schema:
+        db.execute(statement)
+    return db
+
+
+def _insert(db, position, b):
+    timestamp = b.month * 100000000 + b.day * 1000000 + b.hour * 10000 + b.minute * 100 + b.second
+    db.execute('INSERT INTO blocks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (position, b.index, '%016.016x' % (b.nonce), '%016.016x' % (b.pid), '%016.016x' % (b.rid), b.doc_count, b.score, b.sign, timestamp, b.previous_hash, b.hash, b.sig))
+    for number, d in enumerate(b.data):
+        db.execute('INSERT INTO documents VALUES (?, ?, ?, ?, ?)', (position, number, d['type'], d['length'], d['data']))
+
+
+def save_blocks(filename, blocks):
+    db = connect(filename)
+    with db:
+        db.execute('DELETE FROM blocks')
+        db.execute('DELETE FROM documents')
+        for position, b in enumerate(blocks):
+            _insert(db, position, b)
+    db.close()
+    return len(blocks)
+
+
+def append_block(filename, block):
+    db = connect(filename)
+    with db:
+        position = db.execute('SELECT COALESCE(MAX(position) + 1, 0) FROM blocks').fetchone()[0]
+        _insert(db, position, block)
+    db.close()
+    return position
+
+
+def _block(row, documents):
+    position, index, nonce, pid, rid, doc_count, score, sign, timestamp, previous_hash, hash, sig = row
+    b = Block(load=True)
+    b.index, b.nonce, b.pid, b.rid = index, int(nonce, 16), int(pid, 16), int(rid, 16)
+    b.doc_count, b.score, b.sign = doc_count, score, sign
+    b.data = [Document(t, length, data) for t, length, data in documents]
+    b.month, b.day, b.hour = timestamp // 100000000, timestamp // 1000000 % 100, timestamp // 10000 % 100
+    b.minute, b.second = timestamp // 100 % 100, timestamp % 100
+    b.previous_hash, b.hash, b.sig = previous_hash, hash, sig
+    return b
+
+
+def load_blocks(filename, where=None, parameters=()):
+    db = connect(filename)
+    query = 'SELECT * FROM blocks'
+    if where is not None:
+        query += ' WHERE ' + where
+    blocks = []
+    for row in db.execute(query + ' ORDER BY position', parameters).fetchall():
+        documents = db.execute('SELECT type, length, data FROM documents WHERE position = ? ORDER BY number', (row[0],)).fetchall()
+        blocks.append(_block(row, documents))
+    db.close()
+    return blocks
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print('usage: %s <database> <SQL condition on blocks>' % (sys.argv[0]))
+        sys.exit(1)
+    for b in load_blocks(sys.argv[1], ' '.join(sys.argv[2:])):
+        print(b)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+'''
+Time-window queries over a Naughty/Nice chain.
+
+Blocks are appended in the order they are created, so their timestamps (month, day, hour, minute,
+second; the chain does not record a year) never decrease along a chain. A TimeIndex is a sparse
+index over that order: every Nth block's timestamp, index and file offset, kept in
+<chain file>.times. A query binary-searches the index for the last entry before the window and
+streams the chain from there, stopping at the first block after it.
+
+    TimeIndex(chain_filename, <filename>, <every>) - opens (or creates) the index; every is the
+    number of blocks between entries (64 by default).
+
+    update() - indexes the blocks appended since the last update (a header-only scan that resumes
+    at the last entry) and returns the number of entries added. On a new index this builds it.
+
+    query(start, end, <headers_only>) - yields the blocks whose timestamp lies within start and end,
+    inclusive. Both are (month, day, hour, minute, second) tuples and may be cut short, e.g.
+    query((12, 1), (12, 24)) for everything from December 1st to the end of December 24th. With
+    headers_only, the iter_headers() dictionaries are yielded instead of blocks.
+'''
+
+import bisect
+import os
+import struct
+import sys
+
+from naughty_nice import iter_blocks, iter_headers
+
+entry = struct.Struct('>IQQ')  # timestamp, block index, offset
+
+
+def timestamp(t):
+    # (month, day, hour, minute, second) as one comparable integer, MMDDhhmmss
+    return t[0] * 100000000 + t[1] * 1000000 + t[2] * 10000 + t[3] * 100 + t[4]
+
+
+class TimeIndex():
+    def __init__(self, chain_filename, filename=None, every=64):
+        if filename is None:
+            filename = chain_filename + '.times'
+        self.chain_filename = chain_filename
+        self.filename = filename
+        self.every = every
+        self.entries = []
+        if os.path.exists(filename):
+            with open(filename, 'rb') as fh:
+                self.entries = list(entry.iter_unpack(fh.read()))
+
+    def update(self):
+        # resume at the last entry, which is read again but not indexed twice
+        resume = len(self.entries) > 0
+        new = []
+        for n, h in enumerate(iter_headers(self.chain_filename, self.entries[-1][2] if resume else 0)):
+            if n % self.every == 0 and not (n == 0 and resume):
+                new.append((timestamp((h['month'], h['day'], h['hour'], h['minute'], h['second'])), h['index'], h['offset']))
+        with open(self.filename, 'ab') as fh:
+            for e in new:
+                fh.write(entry.pack(*e))
+        self.entries += new
+        return len(new)
+
+    def _start_offset(self, start):
+        # offset of the last entry before the window; blocks with the same timestamp can sit on
+        # both sides of an entry, hence bisect_left
+        n = bisect.bisect_left(self.entries, (start, -1, -1))
+        return self.entries[n - 1][2] if n > 0 else 0
+
+    def query(self, start, end, headers_only=False):
+        start = timestamp(tuple(start) + (0, 0, 0, 0)[len(start) - 1:])
+        end = timestamp(tuple(end) + (31, 23, 59, 59)[len(end) - 1:])
+        offset = self._start_offset(start)
+        if headers_only:
+            for h in iter_headers(self.chain_filename, offset):
+                t = timestamp((h['month'], h['day'], h['hour'], h['minute'], h['second']))
+                if t > end:
+                    return
+                if t >= start:
+                    yield h
+        else:
+            for offset, block in iter_blocks(self.chain_filename, offset):
+                t = timestamp((block.month, block.day, block.hour, block.minute, block.second))
+                if t > end:
+                    return
+                if t >= start:
+                    yield block
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 4:
+        print('usage: %s <chain file> <from MM/DD> <to MM/DD>' % (sys.argv[0]))
+        sys.exit(1)
+    index = TimeIndex(sys.argv[1])
+    index.update()
+    start = [int(x) for x in sys.argv[2].split('/')]
+    end = [int(x) for x in sys.argv[3].split('/')]
+    count = 0
+    for h in index.query(start, end, headers_only=True):
+        print('Block %i: %02.02i/%02.02i %02.02i:%02.02i:%02.02i' % (h['index'], h['month'], h['day'], h['hour'], h['minute'], h['second']))
+        count += 1
+    print('%i block(s)' % (count))
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+'''
+Searches a tampered Naughty/Nice block for UniColl-style edits.
+
+A UniColl collision changes one byte of a 64-byte MD5 block by +1 and the byte at the same position
+of the following MD5 block by -1 (or the other way around). Both versions of the message leave MD5
+in the same internal state, so the block keeps its full_hash() and the chain still verifies. Undoing
+such a change means trying every byte pair 64 bytes apart, which is what this module automates.
+
+Edits are (offset, delta) tuples: the byte at offset into block_data_signed() is changed by delta
+and the byte 64 bytes later by -delta.
+
+    search(block, <target_hash>, <sha256>, <max_pairs>, <alignment>, <processes>) - returns every set
+    of up to max_pairs edits after which the block's full_hash() equals target_hash (by default the
+    block's current full_hash(), i.e. the previous_hash stored in the next block). If sha256 is
+    given, only edit sets after which SHA256(block_data_signed()) matches are returned. UniColl
+    puts the changed byte at offset 9 of the MD5 block, so by default only those positions are
+    tried; pass alignment=None to try every position. The block is split into ranges that are
+    scanned in parallel, each worker carrying the MD5 state forward so every candidate only costs
+    hashing the 128 bytes it touches (plus the rest of the block when target_hash differs from
+    the current hash).
+
+    apply_edits(block, edits) - returns a new Block with the edits applied.
+
+    describe_edit(block, edit) - names the field(s) touched by an edit.
+'''
+
+import io
+import itertools
+import multiprocessing
+import sys
+from Crypto.Hash import MD5, SHA256
+
+from naughty_nice import Block, Chain
+
+_data = None
+
+
+def _init_worker(data):
+    global _data
+    _data = data
+
+
+def _scan(job):
+    # candidates whose first byte falls in MD5 blocks first..last-1, as (offset, delta, neutral, restores)
+    first, last, end, alignment, target = job
+    data = memoryview(_data)
+    hash_obj = MD5.new(data[:first * 64])
+    positions = range(64) if alignment is None else [alignment]
+    found = []
+    for c in range(first, last):
+        start = c * 64
+        pair = bytes(data[start:start + 128])
+        original = hash_obj.copy()
+        original.update(pair)
+        original = original.digest()
+        for o in positions:
+            if start + o + 64 >= end:
+                break
+            for delta in (1, -1):
+                a, b = pair[o] + delta, pair[o + 64] - delta
+                if not (0 <= a <= 255 and 0 <= b <= 255):
+                    continue
+                edited = bytearray(pair)
+                edited[o] = a
+                edited[o + 64] = b
+                h = hash_obj.copy()
+                h.update(edited)
+                if h.digest() == original:
+                    found.append((start + o, delta, True, False))
+                elif target is not None:
+                    h.update(data[start + 128:])
+                    if h.hexdigest() == target:
+                        found.append((start + o, delta, False, True))
+        hash_obj.update(pair[:64])
+    return found
+
+
+def edited_data(data, edits):
+    data = bytearray(data)
+    for offset, delta in edits:
+        data[offset] += delta
+        data[offset + 64] -= delta
+    return bytes(data)
+
+
+def apply_edits(block, edits):
+    return Block(load=True).load_a_block(io.BytesIO(edited_data(block.block_data_signed(), edits)))
+
+
+def describe_edit(block, edit):
+    names = []
+    for offset in (edit[0], edit[0] + 64):
+        for name, start, length in block.field_offsets():
+            if start <= offset < start + length:
+                names.append('%s+%i' % (name, offset - start))
+    return ' / '.join(names)
+
+
+def _overlap(edits):
+    touched = [o for offset, delta in edits for o in (offset, offset + 64)]
+    return len(touched) != len(set(touched))
+
+
+def search(block, target_hash=None, sha256=None, max_pairs=2, alignment=9, processes=None):
+    data = block.block_data_signed()
+    end = len(block.block_data())  # only header fields and documents are candidates
+    current = block.full_hash()
+    if target_hash is None:
+        target_hash = current
+    restore = target_hash != current
+    chunks = (end + 63) // 64
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    step = max(1, chunks // (processes * 4))
+    jobs = [(c, min(c + step, chunks), end, alignment, target_hash if restore else None) for c in range(0, chunks, step)]
+    if processes == 1:
+        _init_worker(data)
+        results = map(_scan, jobs)
+    else:
+        with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(data,)) as pool:
+            results = pool.map(_scan, jobs)
+    neutral, restoring = [], []
+    for found in results:
+        for offset, delta, is_neutral, restores in found:
+            if is_neutral:
+                neutral.append((offset, delta))
+            if restores:
+                restoring.append((offset, delta))
+    # a neutral edit never changes the hash, so it may be combined with anything that restores it
+    if restore:
+        candidates = [(r,) + combo for r in restoring for k in range(max_pairs) for combo in itertools.combinations(neutral, k)]
+    else:
+        candidates = [combo for k in range(1, max_pairs + 1) for combo in itertools.combinations(neutral, k)]
+    edit_sets = []
+    for edits in candidates:
+        if _overlap(edits):
+            continue
+        new_data = edited_data(data, edits)
+        if MD5.new(new_data).hexdigest() != target_hash:
+            continue
+        if sha256 is not None and SHA256.new(new_data).hexdigest() != sha256:
+            continue
+        edit_sets.append(tuple(sorted(edits)))
+    return edit_sets
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print('usage: %s <chain file> <block index> [sha256]' % (sys.argv[0]))
+        sys.exit(1)
+    c = Chain(load=True, filename=sys.argv[1])
+    index = int(sys.argv[2])
+    position = [b.index for b in c.blocks].index(index)
+    block = c.blocks[position]
+    target = block.full_hash()
+    if position + 1 < len(c.blocks):
+        target = c.blocks[position + 1].previous_hash
+    edit_sets = search(block, target, sys.argv[3] if len(sys.argv) > 3 else None)
+    for edits in edit_sets:
+        print('Edit set restoring %s:' % (target))
+        for edit in edits:
+            print('    %+i at offset %i, %+i at offset %i (%s)' % (edit[1], edit[0], -edit[1], edit[0] + 64, describe_edit(block, edit)))
+    print('%i edit set(s) found' % (len(edit_sets)))